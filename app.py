@@ -1,19 +1,56 @@
-from threading import Timer
+from threading import Timer, Lock, Thread, Event, local, get_ident
 import webbrowser
-from flask import Flask, render_template, request, redirect, url_for, flash, session, send_from_directory, jsonify
+import atexit
+import click
+from flask import Flask, render_template, request, redirect, url_for, flash, session, send_from_directory, jsonify, g
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import and_, or_, func, select, text, literal, tuple_, case, event, inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, selectinload, aliased
+from itsdangerous import URLSafeSerializer, BadSignature
+from jinja2 import FileSystemBytecodeCache
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
+from werkzeug.middleware.proxy_fix import ProxyFix
 import os
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import uuid
-from datetime import datetime, timedelta
+import hashlib
+import hmac
+import json
+import queue
+import time
+import zlib
+import zipfile
+import math
+import re
+import importlib.util
+import sqlite3
+import sys
+import io
+import cProfile
+import pstats
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
 # --- ADDED: Imports for new class features ---
 import random
 import string
 
+# --- ADDED: Optional zstd support for response compression ---
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# --- ADDED: Optional NumPy support for grade analytics ---
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 app = Flask(__name__)
 app.secret_key = "supersecretkey"
 
@@ -23,13 +60,67 @@ db_path = os.path.join(basedir, 'app.db')
 app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# --- ADDED: Uploaded files (submissions) ---
+app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER', os.path.join(basedir, 'uploads'))
+app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024
+
+# --- ADDED: Background job worker threads (0 disables the runner in this process) ---
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+
+# --- ADDED: Rate limiting ('memory' per worker, 'sqlite' shared between workers) ---
+app.config['RATE_LIMIT_ENABLED'] = os.environ.get('RATE_LIMIT_ENABLED', '1') == '1'
+app.config['RATE_LIMIT_BACKEND'] = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+app.config['RATE_LIMIT_DB'] = os.environ.get('RATE_LIMIT_DB', os.path.join(basedir, 'ratelimit.db'))
+# Number of reverse proxies in front of the app whose X-Forwarded-* headers are trusted
+app.config['TRUSTED_PROXY_HOPS'] = int(os.environ.get('TRUSTED_PROXY_HOPS', 0))
+
+# --- ADDED: Admin access for metrics and diagnostics ---
+app.config['ADMIN_EMAILS'] = {e.strip() for e in os.environ.get('ADMIN_EMAILS', '').split(',') if e.strip()}
+app.config['ADMIN_TOKEN'] = os.environ.get('ADMIN_TOKEN')
+
+# --- ADDED: Apply pending schema migrations when the app starts ---
+app.config['MIGRATE_ON_STARTUP'] = os.environ.get('MIGRATE_ON_STARTUP', '1') == '1'
+
+# --- ADDED: Embed profile, classes and stats in the dashboard HTML for first paint ---
+app.config['DASHBOARD_BOOTSTRAP'] = os.environ.get('DASHBOARD_BOOTSTRAP', '1') == '1'
+
+# --- ADDED: Request profiling (admins can also force it per request with X-Profile: 1) ---
+app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', os.path.join(basedir, 'profiles'))
+
+# --- ADDED: Template bytecode cache (empty JINJA_BYTECODE_CACHE_DIR disables it) ---
+app.config['JINJA_BYTECODE_CACHE_DIR'] = os.environ.get('JINJA_BYTECODE_CACHE_DIR', os.path.join(basedir, '.jinja_cache'))
+
+# --- ADDED: Outbound mail configuration ---
+# Defaults point at a local SMTP stand-in (e.g. `python -m aiosmtpd -n -l localhost:1025`).
+app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'localhost')
+app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', 1025))
+app.config['MAIL_USE_TLS'] = os.environ.get('MAIL_USE_TLS', '0') == '1'
+app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
+app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
+app.config['MAIL_SENDER'] = os.environ.get('MAIL_SENDER', 'LearnSync <no-reply@learnsync.local>')
+app.config['MAIL_WORKER_ENABLED'] = os.environ.get('MAIL_WORKER_ENABLED', '1') == '1'
+# Links in emails are built from this, never from the request's Host header
+app.config['APP_BASE_URL'] = os.environ.get('APP_BASE_URL', 'http://127.0.0.1:5000').rstrip('/')
+# Development shortcut: skip the inbox and go straight to identity verification
+app.config['PASSWORD_RESET_DEV_REDIRECT'] = os.environ.get('PASSWORD_RESET_DEV_REDIRECT', '0') == '1'
+
 db = SQLAlchemy(app)
 
+# --- ADDED: Persistent template bytecode ---
+# Compiled templates are stored on disk so a fresh worker loads bytecode
+# instead of recompiling the dashboards.
+if app.config['JINJA_BYTECODE_CACHE_DIR']:
+    os.makedirs(app.config['JINJA_BYTECODE_CACHE_DIR'], exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['JINJA_BYTECODE_CACHE_DIR'])
+
 # --- ADDED: Association Table for Student/Class Enrollment ---
 # This table links Students and Classes in a many-to-many relationship.
 enrollments = db.Table('enrollments',
     db.Column('student_id', db.Integer, db.ForeignKey('student.id'), primary_key=True),
-    db.Column('class_id', db.Integer, db.ForeignKey('class.id'), primary_key=True)
+    db.Column('class_id', db.Integer, db.ForeignKey('class.id'), primary_key=True),
+    # The primary key starts with student_id; rosters and fan-out look up by class
+    db.Index('ix_enrollments_class_id', 'class_id', 'student_id')
 )
 
 # Student model
@@ -67,6 +158,59 @@ class Professor(db.Model):
 
     def __repr__(self):
         return f'<Professor {self.username}>'
+
+# --- ADDED: Identity Model ---
+# One row per account across both user tables: the single indexed lookup for
+# login, signup uniqueness and password reset.  Rows are written by mapper
+# events on Student and Professor inside the same flush, so an identity never
+# diverges from the account it points at.
+class Identity(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    email = db.Column(db.String(150), unique=True, nullable=False)
+    user_type = db.Column(db.String(20), nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    password = db.Column(db.String(200), nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_type', 'user_id', name='uq_identity_user'),
+    )
+
+    def account(self):
+        """Loads the Student or Professor this identity belongs to."""
+        model = Student if self.user_type == 'student' else Professor
+        return db.session.get(model, self.user_id)
+
+    def __repr__(self):
+        return f'<Identity {self.email} ({self.user_type})>'
+
+def find_identity(email):
+    if not email:
+        return None
+    return Identity.query.filter_by(email=email.strip()).first()
+
+def identity_insert(mapper, connection, target):
+    connection.execute(Identity.__table__.insert().values(
+        email=target.username, user_type=mapper.class_.__tablename__,
+        user_id=target.id, password=target.password))
+
+def identity_update(mapper, connection, target):
+    state = inspect(target)
+    if not (state.attrs.username.history.has_changes() or state.attrs.password.history.has_changes()):
+        return
+    table = Identity.__table__
+    connection.execute(table.update().where(
+        table.c.user_type == mapper.class_.__tablename__, table.c.user_id == target.id
+    ).values(email=target.username, password=target.password))
+
+def identity_delete(mapper, connection, target):
+    table = Identity.__table__
+    connection.execute(table.delete().where(
+        table.c.user_type == mapper.class_.__tablename__, table.c.user_id == target.id))
+
+for account_model in (Student, Professor):
+    event.listen(account_model, 'after_insert', identity_insert)
+    event.listen(account_model, 'after_update', identity_update)
+    event.listen(account_model, 'after_delete', identity_delete)
         
 # --- ADDED: Class Model ---
 # This model represents a class created by a professor.
@@ -76,15 +220,77 @@ class Class(db.Model):
     description = db.Column(db.String(300))
     code = db.Column(db.String(10), unique=True, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    professor_id = db.Column(db.Integer, db.ForeignKey('professor.id'), nullable=False)
+    professor_id = db.Column(db.Integer, db.ForeignKey('professor.id'), nullable=False, index=True)
+
+    # --- ADDED: Relationships to assignments and calendar events ---
+    assignments = db.relationship('Assignment', backref='parent_class', lazy=True,
+                                  cascade='all, delete-orphan')
+    calendar_events = db.relationship('CalendarEvent', backref='parent_class', lazy=True,
+                                      cascade='all, delete-orphan')
 
     def __repr__(self):
         return f'<Class {self.name} ({self.code})>'
 
+# --- ADDED: Assignment Model ---
+# Assignments belong to a class; their due dates feed the calendar.
+class Assignment(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    class_id = db.Column(db.Integer, db.ForeignKey('class.id'), nullable=False, index=True)
+    title = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.Text)
+    instructions = db.Column(db.Text)
+    points = db.Column(db.Integer, default=100)
+    due_date = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Each assignment owns exactly one derived deadline event
+    calendar_event = db.relationship('CalendarEvent', backref='assignment', uselist=False,
+                                     cascade='all, delete-orphan')
+    submissions = db.relationship('Submission', backref='assignment', lazy=True,
+                                  cascade='all, delete-orphan')
+
+    def __repr__(self):
+        return f'<Assignment {self.title}>'
+
+# --- ADDED: Calendar Event Model ---
+# An event is either class-wide (class_id set) or personal (owner_type/owner_id set).
+# Both lookups are served by a composite index ending in event_date so range
+# queries for the visible month only touch the matching rows.
+class CalendarEvent(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(200), nullable=False)
+    event_date = db.Column(db.Date, nullable=False)
+    class_id = db.Column(db.Integer, db.ForeignKey('class.id'))
+    owner_type = db.Column(db.String(20))
+    owner_id = db.Column(db.Integer)
+    assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id'), unique=True)
+    source = db.Column(db.String(20), default='manual')  # 'manual' or 'assignment'
+    version = db.Column(db.Integer, default=1, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_calendar_event_class_date', 'class_id', 'event_date'),
+        db.Index('ix_calendar_event_owner_date', 'owner_type', 'owner_id', 'event_date'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'title': self.title,
+            'date': self.event_date.isoformat(),
+            'class_id': str(self.class_id) if self.class_id else None,
+            'class_name': self.parent_class.name if self.class_id else None,
+            'source': self.source,
+            'assignment_id': str(self.assignment_id) if self.assignment_id else None
+        }
+
+    def __repr__(self):
+        return f'<CalendarEvent {self.title} on {self.event_date}>'
+
 # Password Reset Token model
 class PasswordResetToken(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    email = db.Column(db.String(150), nullable=False)
+    email = db.Column(db.String(150), nullable=False, index=True)
     token = db.Column(db.String(100), unique=True, nullable=False)
     user_type = db.Column(db.String(20), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -94,6 +300,382 @@ class PasswordResetToken(db.Model):
     def __repr__(self):
         return f'<PasswordResetToken {self.token}>'
 
+# --- ADDED: Notification Model ---
+# Append-only event log behind the SSE stream.  The autoincrement id doubles as
+# the SSE event id, so reconnecting clients replay everything after Last-Event-ID.
+class Notification(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_type = db.Column(db.String(20), nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(50), nullable=False)
+    message = db.Column(db.String(300), nullable=False)
+    class_id = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_notification_user_id', 'user_type', 'user_id', 'id'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'message': self.message,
+            'class_id': str(self.class_id) if self.class_id else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+    def __repr__(self):
+        return f'<Notification {self.kind} for {self.user_type} {self.user_id}>'
+
+# --- ADDED: Outbound Email Model ---
+# Persisted mail queue.  Requests only insert rows; the mail worker delivers them.
+# Announcement rows carry a comma-separated recipient batch sent as Bcc.
+class OutboundEmail(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    recipients = db.Column(db.Text, nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    is_batch = db.Column(db.Boolean, default=False)
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    claimed_by = db.Column(db.String(50))
+    claimed_at = db.Column(db.DateTime)
+    last_error = db.Column(db.String(300))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_outbound_email_due', 'status', 'next_attempt_at'),
+    )
+
+    def __repr__(self):
+        return f'<OutboundEmail {self.subject} ({self.status})>'
+
+# --- ADDED: Job Model ---
+# Durable background jobs.  Workers claim queued rows with a single UPDATE, so
+# a job is only ever picked up once even with several worker processes.
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), default='queued', nullable=False)  # queued, running, succeeded, failed, cancelled
+    payload = db.Column(db.Text)
+    result = db.Column(db.Text)
+    error = db.Column(db.String(500))
+    progress = db.Column(db.Integer, default=0, nullable=False)
+    progress_message = db.Column(db.String(200))
+    cancel_requested = db.Column(db.Boolean, default=False, nullable=False)
+    owner_type = db.Column(db.String(20))
+    owner_id = db.Column(db.Integer)
+    claimed_by = db.Column(db.String(50))
+    heartbeat_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_job_status_type', 'status', 'job_type', 'id'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'type': self.job_type,
+            'status': self.status,
+            'progress': self.progress,
+            'progress_message': self.progress_message,
+            'cancel_requested': self.cancel_requested,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.job_type} ({self.status})>'
+
+# --- ADDED: Submission Models ---
+# One submission per student per assignment; uploaded files live on disk under
+# UPLOAD_FOLDER and are referenced by SubmissionFile rows.
+class Submission(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id'), nullable=False)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
+    content = db.Column(db.Text)
+    submitted_at = db.Column(db.DateTime, default=datetime.utcnow)
+    grade = db.Column(db.Float)
+    feedback = db.Column(db.Text)
+    graded_at = db.Column(db.DateTime)
+
+    student = db.relationship('Student')
+    files = db.relationship('SubmissionFile', backref='submission', lazy=True,
+                            cascade='all, delete-orphan', order_by='SubmissionFile.id')
+
+    __table_args__ = (
+        db.UniqueConstraint('assignment_id', 'student_id', name='uq_submission_assignment_student'),
+    )
+
+    def __repr__(self):
+        return f'<Submission assignment={self.assignment_id} student={self.student_id}>'
+
+class SubmissionFile(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    submission_id = db.Column(db.Integer, db.ForeignKey('submission.id'), nullable=False, index=True)
+    original_name = db.Column(db.String(255), nullable=False)
+    stored_path = db.Column(db.String(500), nullable=False)
+    content_type = db.Column(db.String(100))
+    size = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<SubmissionFile {self.original_name}>'
+
+# --- ADDED: Gradebook Version Model ---
+# Bumped in the same transaction as any change to a class's grades, roster or
+# assignments; analytics caches are keyed by it.
+class GradebookVersion(db.Model):
+    class_id = db.Column(db.Integer, db.ForeignKey('class.id'), primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f'<GradebookVersion class={self.class_id} v{self.version}>'
+
+# --- ADDED: Attendance Models ---
+# A professor opens a session with a short check-in code; students check in
+# against it.  Records are append-only and unique per student per session;
+# present_count is refreshed with every batch written for the session.
+class AttendanceSession(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    class_id = db.Column(db.Integer, db.ForeignKey('class.id'), nullable=False, index=True)
+    code = db.Column(db.String(10), unique=True, nullable=False)
+    opened_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    closes_at = db.Column(db.DateTime, nullable=False)
+    present_count = db.Column(db.Integer, default=0, nullable=False)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'class_id': self.class_id,
+            'code': self.code,
+            'opened_at': self.opened_at.isoformat(),
+            'closes_at': self.closes_at.isoformat(),
+            'is_open': self.closes_at > datetime.utcnow(),
+            'present': self.present_count
+        }
+
+    def __repr__(self):
+        return f'<AttendanceSession {self.code} class={self.class_id}>'
+
+class AttendanceRecord(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.Integer, db.ForeignKey('attendance_session.id'), nullable=False)
+    class_id = db.Column(db.Integer, db.ForeignKey('class.id'), nullable=False)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
+    checked_in_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('session_id', 'student_id', name='uq_attendance_session_student'),
+        db.Index('ix_attendance_record_class_student', 'class_id', 'student_id'),
+    )
+
+    def __repr__(self):
+        return f'<AttendanceRecord session={self.session_id} student={self.student_id}>'
+
+# --- ADDED: Change Feed Model ---
+# One row per change to a class, its roster or its assignments, written in the
+# same transaction as the change.  SQLite serializes writers, so seq order is
+# commit order and a client that has seen seq N has seen every change up to N.
+class ChangeLog(db.Model):
+    seq = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(20), nullable=False)  # 'class', 'enrollment' or 'assignment'
+    action = db.Column(db.String(10), nullable=False)  # 'upsert' or 'delete'
+    entity_id = db.Column(db.Integer, nullable=False)  # class, student or assignment id
+    class_id = db.Column(db.Integer, nullable=False)
+    professor_id = db.Column(db.Integer, nullable=False)
+    student_id = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_change_log_class_seq', 'class_id', 'seq'),
+        db.Index('ix_change_log_professor_seq', 'professor_id', 'seq'),
+        db.Index('ix_change_log_student_seq', 'student_id', 'seq'),
+        # AUTOINCREMENT: a pruned or rolled-back seq is never handed out again
+        {'sqlite_autoincrement': True},
+    )
+
+    def __repr__(self):
+        return f'<ChangeLog {self.seq} {self.entity} {self.action} {self.entity_id}>'
+
+# --- ADDED: Schema migrations ---
+# db.create_all() only creates missing tables, so changes to existing tables
+# live in versioned scripts under migrations/ (NNNN_description.py, each with
+# an upgrade(ctx) function).  Applied versions are recorded in
+# schema_migrations.  Every step runs in its own short transaction: columns
+# are added with ALTER TABLE ADD COLUMN (constant time in SQLite) and data is
+# backfilled in rowid-ordered batches whose position is saved in
+# migration_progress, so a large backfill never holds the write lock for long
+# and an interrupted run resumes where it stopped.  A row in migration_lock
+# serializes runners across worker processes; a lock older than
+# MIGRATION_LOCK_STALE_SECONDS is assumed to belong to a crashed process.
+MIGRATIONS_DIR = os.path.join(basedir, 'migrations')
+MIGRATION_FILE_PATTERN = re.compile(r'^(\d{4})_(\w+)\.py$')
+BACKFILL_BATCH_SIZE = 1000
+BACKFILL_PAUSE_SECONDS = 0.01
+MIGRATION_LOCK_WAIT_SECONDS = 600
+MIGRATION_LOCK_STALE_SECONDS = 1800
+MIGRATION_LOCK_POLL_SECONDS = 0.5
+
+class MigrationContext:
+    """Helpers handed to each migration's upgrade() function."""
+
+    def __init__(self, engine, version):
+        self.engine = engine
+        self.version = version
+
+    def execute(self, sql, params=None):
+        with self.engine.begin() as conn:
+            return conn.execute(text(sql), params or {})
+
+    def table_exists(self, table):
+        with self.engine.connect() as conn:
+            return conn.execute(text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:t"),
+                                {'t': table}).first() is not None
+
+    def column_exists(self, table, column):
+        with self.engine.connect() as conn:
+            return any(row[1] == column for row in conn.execute(text(f'PRAGMA table_info("{table}")')))
+
+    def add_column(self, table, column, ddl):
+        """Adds a column if it is missing; ddl is the type and constraints, e.g. 'FLOAT'."""
+        if self.table_exists(table) and not self.column_exists(table, column):
+            self.execute(f'ALTER TABLE "{table}" ADD COLUMN "{column}" {ddl}')
+            print(f"  + {table}.{column}")
+
+    def create_index(self, name, table, columns, unique=False):
+        if self.table_exists(table):
+            cols = ', '.join(f'"{c}"' for c in columns)
+            self.execute(f'CREATE {"UNIQUE " if unique else ""}INDEX IF NOT EXISTS "{name}" ON "{table}" ({cols})')
+
+    def backfill(self, step, table, batch_sql, batch_size=BACKFILL_BATCH_SIZE):
+        """Runs batch_sql over a table in rowid order, one short transaction per batch.
+
+        batch_sql receives :first and :last (inclusive rowid bounds of the batch)
+        and must be idempotent for rows it has already processed.  Progress is
+        committed with each batch, so re-running resumes after the last one.
+        """
+        if not self.table_exists(table):
+            return
+        with self.engine.connect() as conn:
+            max_rowid = conn.execute(text(f'SELECT MAX(rowid) FROM "{table}"')).scalar() or 0
+            last = conn.execute(text(
+                'SELECT last_rowid FROM migration_progress WHERE version = :v AND step = :s'),
+                {'v': self.version, 's': step}).scalar() or 0
+        started_from = last
+        while last < max_rowid:
+            with self.engine.begin() as conn:
+                upper = conn.execute(text(
+                    f'SELECT MAX(rowid) FROM (SELECT rowid FROM "{table}" WHERE rowid > :last '
+                    f'ORDER BY rowid LIMIT :n)'), {'last': last, 'n': batch_size}).scalar()
+                if upper is None:
+                    break
+                conn.execute(text(batch_sql), {'first': last + 1, 'last': upper})
+                conn.execute(text(
+                    'INSERT INTO migration_progress (version, step, last_rowid, updated_at) '
+                    'VALUES (:v, :s, :r, :t) ON CONFLICT(version, step) '
+                    'DO UPDATE SET last_rowid = excluded.last_rowid, updated_at = excluded.updated_at'),
+                    {'v': self.version, 's': step, 'r': upper, 't': datetime.utcnow()})
+            last = upper
+            done = (last - started_from) / max(max_rowid - started_from, 1) * 100
+            print(f"  {step}: {table} rowid {last}/{max_rowid} ({done:.0f}%)")
+            time.sleep(BACKFILL_PAUSE_SECONDS)  # let request writers in between batches
+
+def discover_migrations():
+    migrations = []
+    if os.path.isdir(MIGRATIONS_DIR):
+        for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+            match = MIGRATION_FILE_PATTERN.match(filename)
+            if match:
+                migrations.append((int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+    return migrations
+
+def ensure_migration_tables(engine):
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE IF NOT EXISTS schema_migrations '
+                          '(version INTEGER PRIMARY KEY, name VARCHAR(200) NOT NULL, applied_at DATETIME)'))
+        conn.execute(text('CREATE TABLE IF NOT EXISTS migration_progress '
+                          '(version INTEGER NOT NULL, step VARCHAR(100) NOT NULL, last_rowid INTEGER NOT NULL, '
+                          'updated_at DATETIME, PRIMARY KEY (version, step))'))
+        conn.execute(text('CREATE TABLE IF NOT EXISTS migration_lock '
+                          '(id INTEGER PRIMARY KEY CHECK (id = 1), owner VARCHAR(100) NOT NULL, acquired_at DATETIME NOT NULL)'))
+
+def acquire_migration_lock(engine):
+    """Blocks until this process holds migration_lock; returns the owner token."""
+    owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+    deadline = time.monotonic() + MIGRATION_LOCK_WAIT_SECONDS
+    waiting = False
+    while True:
+        with engine.begin() as conn:
+            conn.execute(text('DELETE FROM migration_lock WHERE acquired_at < :stale'),
+                         {'stale': datetime.utcnow() - timedelta(seconds=MIGRATION_LOCK_STALE_SECONDS)})
+            conn.execute(text('INSERT OR IGNORE INTO migration_lock (id, owner, acquired_at) VALUES (1, :o, :t)'),
+                         {'o': owner, 't': datetime.utcnow()})
+            holder = conn.execute(text('SELECT owner FROM migration_lock WHERE id = 1')).scalar()
+        if holder == owner:
+            return owner
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Timed out waiting for migration lock held by {holder}")
+        if not waiting:
+            print(f"… Waiting for migrations running in {holder}")
+            waiting = True
+        time.sleep(MIGRATION_LOCK_POLL_SECONDS)
+
+def release_migration_lock(engine, owner):
+    with engine.begin() as conn:
+        conn.execute(text('DELETE FROM migration_lock WHERE id = 1 AND owner = :o'), {'o': owner})
+
+def applied_migrations(engine):
+    with engine.connect() as conn:
+        return {row[0] for row in conn.execute(text('SELECT version FROM schema_migrations'))}
+
+def run_migrations():
+    """Applies every pending migration in version order; returns the versions applied."""
+    engine = db.engine
+    ensure_migration_tables(engine)
+    owner = acquire_migration_lock(engine)
+    try:
+        # Read after taking the lock so versions another worker just applied are skipped
+        done = applied_migrations(engine)
+        applied = []
+        for version, name, path in discover_migrations():
+            if version in done:
+                continue
+            print(f"→ Applying migration {version:04d}_{name}")
+            spec = importlib.util.spec_from_file_location(f"migration_{version:04d}", path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            module.upgrade(MigrationContext(engine, version))
+            with engine.begin() as conn:
+                conn.execute(text('INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)'),
+                             {'v': version, 'n': name, 't': datetime.utcnow()})
+            applied.append(version)
+        return applied
+    finally:
+        release_migration_lock(engine, owner)
+
+@app.cli.command('migrate')
+@click.option('--status', is_flag=True, help='List migrations without applying them.')
+def migrate_command(status):
+    """Apply pending schema migrations."""
+    if status:
+        ensure_migration_tables(db.engine)
+        done = applied_migrations(db.engine)
+        for version, name, _ in discover_migrations():
+            click.echo(f"{'applied' if version in done else 'pending'}  {version:04d}_{name}")
+        return
+    applied = run_migrations()
+    click.echo(f"Applied {len(applied)} migration(s)." if applied else "Database is up to date.")
+
 # Initialize database
 with app.app_context():
     try:
@@ -108,6 +690,12 @@ with app.app_context():
         tables = inspector.get_table_names()
         print("✓ Tables in database:", tables)
         
+        # Bring existing tables up to date (also available as `flask migrate`)
+        if app.config['MIGRATE_ON_STARTUP']:
+            applied = run_migrations()
+            if applied:
+                print(f"✓ Applied migrations: {applied}")
+        
     except Exception as e:
         print(f"❌ Error with database: {e}")
 
@@ -161,6 +749,165 @@ def serve_styles_css():
 def serve_script_js():
     return send_from_directory(basedir, 'script.js')
 
+# --- ADDED: Token-bucket rate limiting ---
+# Checked in a before_request hook, so a throttled attempt never reaches the
+# ORM or the password hash.  Each rule has a bucket per client IP and, where the
+# request names an account, a bucket per account; a bucket holds `capacity`
+# tokens and refills at capacity/period per second.  The memory backend is
+# per-process; RATE_LIMIT_BACKEND='sqlite' shares buckets between workers
+# through a small separate SQLite file updated with one UPSERT per check.
+# Behind a reverse proxy, set TRUSTED_PROXY_HOPS so request.remote_addr is the
+# client address from X-Forwarded-For rather than the proxy's.
+if app.config['TRUSTED_PROXY_HOPS']:
+    hops = app.config['TRUSTED_PROXY_HOPS']
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops)
+
+# A whole classroom often shares one address (campus NAT, or the proxy when
+# TRUSTED_PROXY_HOPS is unset), so the per-IP budgets only stop floods; the
+# per-account budgets are what throttle guessing against one account.
+RATE_LIMITS = {
+    # endpoint: methods, (capacity, period seconds) per IP and per account, account source, template
+    'login': {'methods': {'POST'}, 'ip': (300, 60), 'account': (5, 60),
+              'account_from': 'form:email', 'template': 'login.html'},
+    'signup': {'methods': {'POST'}, 'ip': (300, 3600), 'account': None,
+               'account_from': None, 'template': 'signup.html'},
+    'forgot_password': {'methods': {'POST'}, 'ip': (100, 3600), 'account': (3, 3600),
+                        'account_from': 'form:email', 'template': 'forgot_password.html'},
+    'join_class': {'methods': {'POST'}, 'ip': (300, 60), 'account': (10, 60),
+                   'account_from': 'session', 'template': None},
+}
+RATE_LIMIT_MAX_BUCKETS = 100000
+RATE_LIMIT_EVICT_TO = int(RATE_LIMIT_MAX_BUCKETS * 0.9)
+
+class MemoryRateLimiter:
+    """Per-process token buckets: key -> [tokens, last refill time, capacity, rate], oldest use first."""
+
+    def __init__(self):
+        self.buckets = OrderedDict()
+        self.lock = Lock()
+
+    def evict(self, now):
+        """Frees room without forgiving throttled keys while anything else can go.
+
+        Buckets that have refilled to capacity behave exactly like missing ones
+        and go first; then the least recently used buckets that still have a
+        token; throttled (empty) buckets only as a last resort.
+        """
+        def level(bucket):
+            tokens, updated, capacity, rate = bucket
+            return min(capacity, tokens + (now - updated) * rate)
+
+        for key in [key for key, bucket in self.buckets.items() if level(bucket) >= bucket[2]]:
+            del self.buckets[key]
+        excess = len(self.buckets) - RATE_LIMIT_EVICT_TO
+        if excess > 0:
+            for key in [key for key, bucket in self.buckets.items() if level(bucket) >= 1][:excess]:
+                del self.buckets[key]
+        while len(self.buckets) > RATE_LIMIT_EVICT_TO:
+            self.buckets.popitem(last=False)
+
+    def consume(self, key, capacity, period):
+        """Takes one token; returns 0 if allowed, else seconds until a token is available."""
+        rate = capacity / period
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                if len(self.buckets) >= RATE_LIMIT_MAX_BUCKETS:
+                    self.evict(now)
+                bucket = self.buckets[key] = [capacity, now, capacity, rate]
+            else:
+                self.buckets.move_to_end(key)
+            tokens = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                return 0
+            bucket[0] = tokens
+            return (1 - tokens) / rate
+
+class SQLiteRateLimiter:
+    """Token buckets shared by every worker through a SQLite file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.local = local()
+        with self.connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS rate_bucket '
+                         '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)')
+
+    def connect(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+        return conn
+
+    def consume(self, key, capacity, period):
+        rate = capacity / period
+        now = time.time()
+        conn = self.connect()
+        # Refill and take a token atomically; no row comes back when the bucket is empty
+        row = conn.execute(
+            'INSERT INTO rate_bucket (key, tokens, updated) VALUES (?, ?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET '
+            '  tokens = min(?, tokens + (excluded.updated - updated) * ?) - 1, '
+            '  updated = excluded.updated '
+            'WHERE min(?, tokens + (excluded.updated - updated) * ?) >= 1 '
+            'RETURNING tokens',
+            (key, capacity - 1, now, capacity, rate, capacity, rate)).fetchone()
+        if row is not None:
+            return 0
+        current = conn.execute('SELECT tokens, updated FROM rate_bucket WHERE key = ?', (key,)).fetchone()
+        tokens = min(capacity, current[0] + (now - current[1]) * rate) if current else 0
+        return max(0.0, (1 - tokens) / rate)
+
+def create_rate_limiter():
+    if app.config['RATE_LIMIT_BACKEND'] == 'sqlite':
+        return SQLiteRateLimiter(app.config['RATE_LIMIT_DB'])
+    return MemoryRateLimiter()
+
+rate_limiter = create_rate_limiter()
+
+def rate_limit_account(source):
+    if source == 'form:email':
+        return (request.form.get('email') or '').strip().lower() or None
+    if source == 'session':
+        return session.get('user_id')
+    return None
+
+@app.before_request
+def enforce_rate_limits():
+    if not app.config['RATE_LIMIT_ENABLED']:
+        return None
+    rule = RATE_LIMITS.get(request.endpoint)
+    if not rule or request.method not in rule['methods']:
+        return None
+
+    checks = [(f"{request.endpoint}:ip:{request.remote_addr}", rule['ip'])]
+    account = rate_limit_account(rule['account_from']) if rule['account'] else None
+    if account is not None:
+        checks.append((f"{request.endpoint}:account:{account}", rule['account']))
+
+    retry_after = 0
+    for key, (capacity, period) in checks:
+        retry_after = max(retry_after, rate_limiter.consume(key, capacity, period))
+    if not retry_after:
+        return None
+
+    seconds = int(math.ceil(retry_after))
+    message = f"Too many attempts. Please try again in {seconds} seconds."
+    if request.path.startswith('/api/') or not rule['template']:
+        response = jsonify({'error': message})
+    else:
+        flash(message)
+        response = app.make_response(render_template(rule['template']))
+    response.status_code = 429
+    response.headers['Retry-After'] = str(seconds)
+    return response
+
 # Error handlers for JSON responses
 @app.errorhandler(404)
 def not_found_error(error):
@@ -182,38 +929,6 @@ def unauthorized_error(error):
     return redirect(url_for('login'))
 
 # Debug routes
-@app.route('/debug/api-check')
-def debug_api_check():
-    """Debug route to check API endpoints"""
-    endpoints = {
-        'professor_classes': '/api/professor/classes',
-        'student_stats': '/api/student/stats', 
-        'professor_stats': '/api/professor/stats',
-        'profile': '/api/profile'
-    }
-    
-    results = {}
-    with app.test_client() as client:
-        for name, endpoint in endpoints.items():
-            try:
-                # Set session for testing
-                with client.session_transaction() as sess:
-                    if 'user_id' in session:
-                        sess['user_id'] = session['user_id']
-                        sess['user_type'] = session['user_type']
-                
-                response = client.get(endpoint)
-                results[name] = {
-                    'status_code': response.status_code,
-                    'content_type': response.content_type,
-                    'is_json': response.is_json,
-                    'data_preview': response.get_data(as_text=True)[:100]
-                }
-            except Exception as e:
-                results[name] = {'error': str(e)}
-    
-    return jsonify(results)
-
 @app.route('/debug/session')
 def debug_session():
     return jsonify(dict(session))
@@ -227,16 +942,12 @@ def index():
     return render_template('index.html')
 
 
-@app.route('/api/profile')
-def get_profile():
-    if 'user_id' not in session:
-        return {'error': 'Unauthorized'}, 401
-    
-    user_type = session.get('user_type')
-    user_id = session.get('user_id')
-    
+# --- ADDED: Dashboard payload builders ---
+# Shared by the JSON endpoints, /api/bootstrap and the data embedded in the
+# rendered dashboards, so all three always agree and each uses a fixed number
+# of queries regardless of how many classes or students there are.
+def profile_payload(user, user_type):
     if user_type == 'student':
-        user = Student.query.get(user_id)
         return {
             'first_name': user.first_name,
             'last_name': user.last_name,
@@ -246,16 +957,315 @@ def get_profile():
             'year_level': user.year_level,
             'user_type': 'student'
         }
+    return {
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'email': user.username,
+        'professor_id': user.professor_id,
+        'department': user.department,
+        'user_type': 'professor'
+    }
+
+def professor_classes_payload(professor_id):
+    """Classes with rosters and assignments: one query each for classes, students and assignments."""
+    classes = Class.query.options(selectinload(Class.students)).filter_by(professor_id=professor_id).all()
+
+    assignments_by_class = {}
+    if classes:
+        class_assignments = Assignment.query.filter(
+            Assignment.class_id.in_([c.id for c in classes])
+        ).order_by(Assignment.due_date).all()
+        for assignment in class_assignments:
+            assignments_by_class.setdefault(assignment.class_id, []).append(
+                assignment_to_dict(assignment))
+
+    classes_data = []
+    for cls in classes:
+        students_list = [{
+            'id': student.student_id,
+            'name': f"{student.first_name} {student.last_name}",
+            'email': student.username
+        } for student in cls.students]
+
+        classes_data.append({
+            'id': str(cls.id),
+            'name': cls.name,
+            'description': cls.description,
+            'code': cls.code,
+            'students': students_list,
+            'materials': [],
+            'assignments': assignments_by_class.get(cls.id, [])
+        })
+    return classes_data
+
+def student_classes_payload(student):
+    """Enrolled classes with professor names; professors are fetched in one query."""
+    classes = student.classes
+    professor_ids = {cls.professor_id for cls in classes}
+    professors = {}
+    if professor_ids:
+        professors = {p.id: p for p in Professor.query.filter(Professor.id.in_(professor_ids))}
+
+    return [student_class_dict(cls, professors.get(cls.professor_id)) for cls in classes]
+
+def student_class_dict(cls, professor):
+    return {
+        'id': str(cls.id),
+        'name': cls.name,
+        'description': cls.description,
+        'code': cls.code,
+        'professor_name': f"{professor.first_name} {professor.last_name}" if professor else "N/A"
+    }
+
+def professor_stats_payload(professor_id, classes_data=None):
+    """Totals derived from an already-built class list (or COUNT queries) plus task counts."""
+    if classes_data is not None:
+        total_classes = len(classes_data)
+        total_students = sum(len(c['students']) for c in classes_data)
+    else:
+        total_classes = db.session.query(func.count(Class.id)).filter(
+            Class.professor_id == professor_id).scalar()
+        total_students = db.session.query(func.count()).select_from(enrollments).join(
+            Class, Class.id == enrollments.c.class_id).filter(
+            Class.professor_id == professor_id).scalar()
+    # Ungraded submissions and deadlines in the coming week
+    now = datetime.utcnow()
+    pending_tasks = db.session.query(func.count(Submission.id)).join(
+        Assignment, Assignment.id == Submission.assignment_id).join(
+        Class, Class.id == Assignment.class_id).filter(
+        Class.professor_id == professor_id, Submission.grade.is_(None)).scalar()
+    upcoming_deadlines = db.session.query(func.count(Assignment.id)).join(
+        Class, Class.id == Assignment.class_id).filter(
+        Class.professor_id == professor_id,
+        Assignment.due_date >= now, Assignment.due_date < now + timedelta(days=7)).scalar()
+    return {
+        'total_classes': total_classes,
+        'total_students': total_students,
+        'pending_tasks': pending_tasks,
+        'upcoming_deadlines': upcoming_deadlines
+    }
+
+def student_stats_payload(student):
+    return {
+        'enrolled_classes': len(student.classes),
+        'pending_assignments': 0, # Mocked for now
+        'upcoming_deadlines': 0, # Mocked for now
+        'completed_assignments': 0 # Mocked for now
+    }
+
+def bootstrap_payload(user, user_type, since=None):
+    """Everything a dashboard needs for first paint.
+
+    When the browser already holds the class list at change-feed position
+    since, only the changes after it are embedded instead of the full list.
+    """
+    if since is not None:
+        sync = sync_payload(user_type, user.id, since)
+        if not sync['reset']:
+            if user_type == 'student':
+                stats = student_stats_payload(user)
+            else:
+                stats = professor_stats_payload(user.id)
+            return {
+                'profile': profile_payload(user, user_type),
+                'sync': sync,
+                'stats': stats,
+                'sync_seq': sync['seq'],
+                'sync_owner': sync['owner']
+            }
+    # Read before the classes so a change racing this request is replayed by /api/sync
+    sync_seq = latest_change_seq()
+    if user_type == 'student':
+        classes_data = student_classes_payload(user)
+        stats = student_stats_payload(user)
+    else:
+        classes_data = professor_classes_payload(user.id)
+        stats = professor_stats_payload(user.id, classes_data)
+    return {
+        'profile': profile_payload(user, user_type),
+        'classes': classes_data,
+        'stats': stats,
+        'sync_seq': sync_seq,
+        'sync_owner': sync_owner(user_type, user.id)
+    }
+
+@app.route('/api/profile')
+def get_profile():
+    if 'user_id' not in session:
+        return {'error': 'Unauthorized'}, 401
+    
+    user_type = session.get('user_type')
+    user_id = session.get('user_id')
+    
+    if user_type == 'student':
+        user = Student.query.get(user_id)
     else:
         user = Professor.query.get(user_id)
-        return {
-            'first_name': user.first_name,
-            'last_name': user.last_name,
-            'email': user.username,
-            'professor_id': user.professor_id,
-            'department': user.department,
-            'user_type': 'professor'
+    
+    if not user:
+        return {'error': 'User not found'}, 404
+    return profile_payload(user, user_type)
+
+# --- ADDED: Combined first-paint endpoint ---
+@app.route('/api/bootstrap')
+def get_bootstrap():
+    """Profile, class list and stats in a single round-trip."""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    user_type = session.get('user_type')
+    user_id = session.get('user_id')
+    
+    user = Student.query.get(user_id) if user_type == 'student' else Professor.query.get(user_id)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    return jsonify(bootstrap_payload(user, user_type, since=request.args.get('since', type=int)))
+
+# --- ADDED: Change feed ---
+# Clients keep the class list they were given together with its sync_seq and
+# call /api/sync?since=<seq> to receive only what changed since.  Students see
+# their own enrollment changes (as class upserts/deletes) plus changes to the
+# classes they are enrolled in; professors see every change to their classes.
+# Several changes to the same item collapse into the latest one.  A client
+# whose seq has been pruned, or that is too far behind, is told to reset and
+# reload the full list.  The class list endpoint reports the seq it reflects in
+# X-Sync-Seq, and browsers echo the seq of the list they hold in the
+# class_sync cookie so the dashboard page can embed deltas instead of the list.
+CHANGE_LOG_MAX_ROWS = 100000
+SYNC_MAX_CHANGES = 500
+SYNC_COOKIE = 'class_sync'
+
+def record_change(entity, action, entity_id, cls, student_id=None):
+    """Appends to the change feed inside the caller's transaction."""
+    db.session.add(ChangeLog(entity=entity, action=action, entity_id=entity_id,
+                             class_id=cls.id, professor_id=cls.professor_id, student_id=student_id))
+    # Keep the log bounded; seq is monotonic so this is a primary key range delete
+    newest = select(func.max(ChangeLog.seq)).scalar_subquery()
+    ChangeLog.query.filter(ChangeLog.seq <= newest - CHANGE_LOG_MAX_ROWS).delete(synchronize_session=False)
+
+def latest_change_seq():
+    return db.session.query(func.max(ChangeLog.seq)).scalar() or 0
+
+def sync_owner(user_type, user_id):
+    """Identifies whose class list a client-side cache holds."""
+    return f"{user_type}:{user_id}"
+
+def cached_sync_seq(user_type, user_id):
+    """Seq of the class list this browser holds for the user, from the class_sync cookie."""
+    owner, _, seq = request.cookies.get(SYNC_COOKIE, '').rpartition(':')
+    if owner != sync_owner(user_type, user_id) or not seq.isdigit():
+        return None
+    return int(seq)
+
+def with_sync_headers(response, seq, user_type, user_id):
+    response.headers['X-Sync-Seq'] = str(seq)
+    response.headers['X-Sync-Owner'] = sync_owner(user_type, user_id)
+    return response
+
+def serialize_changes(rows, user_type):
+    """Collapses change rows to the latest change per item and attaches current data."""
+    latest = {}
+    for row in rows:
+        if user_type == 'student' and row.entity == 'enrollment':
+            # A student's own enrollment adds or removes the class from their list
+            key = ('class', None, row.class_id)
+        elif row.entity == 'enrollment':
+            # The same student can join one class and leave another
+            key = ('enrollment', row.class_id, row.entity_id)
+        else:
+            key = (row.entity, None, row.entity_id)
+        latest.pop(key, None)
+        latest[key] = row
+
+    def upserted(kind):
+        return [entity_id for (k, _, entity_id), row in latest.items() if k == kind and row.action == 'upsert']
+
+    classes = {c.id: c for c in Class.query.filter(Class.id.in_(upserted('class')))} if upserted('class') else {}
+    professors = {}
+    if user_type == 'student' and classes:
+        professors = {p.id: p for p in Professor.query.filter(
+            Professor.id.in_({c.professor_id for c in classes.values()}))}
+    assignment_ids = upserted('assignment')
+    assignments = {a.id: a for a in Assignment.query.filter(Assignment.id.in_(assignment_ids))} if assignment_ids else {}
+    student_ids = [entity_id for (k, _, entity_id) in latest if k == 'enrollment']
+    students = {s.id: s for s in Student.query.filter(Student.id.in_(student_ids))} if student_ids else {}
+
+    changes = []
+    for (kind, _, entity_id), row in latest.items():
+        change = {
+            'seq': row.seq,
+            'type': kind,
+            'action': row.action,
+            'id': str(entity_id),
+            'class_id': str(row.class_id),
+            'data': None
         }
+        if kind == 'class' and row.action == 'upsert':
+            cls = classes.get(entity_id)
+            if not cls:
+                change['action'] = 'delete'
+            elif user_type == 'student':
+                change['data'] = student_class_dict(cls, professors.get(cls.professor_id))
+            else:
+                change['data'] = {'id': str(cls.id), 'name': cls.name,
+                                  'description': cls.description, 'code': cls.code}
+        elif kind == 'assignment' and row.action == 'upsert':
+            assignment = assignments.get(entity_id)
+            if assignment:
+                change['data'] = assignment_to_dict(assignment)
+            else:
+                change['action'] = 'delete'
+        elif kind == 'enrollment':
+            # Rosters are keyed by school ID on the professor dashboard
+            student = students.get(entity_id)
+            if student:
+                change['id'] = student.student_id
+                if row.action == 'upsert':
+                    change['data'] = {'id': student.student_id,
+                                      'name': f"{student.first_name} {student.last_name}",
+                                      'email': student.username}
+        changes.append(change)
+    # Classes first, so an assignment or roster change for a class created since
+    # is not dropped when a later edit to that class collapsed its row forward
+    changes.sort(key=lambda c: (c['type'] != 'class', c['seq']))
+    return changes
+
+def sync_payload(user_type, user_id, since):
+    """Changes visible to a user since the given sequence number."""
+    result = {'owner': sync_owner(user_type, user_id), 'since': since,
+              'seq': latest_change_seq(), 'reset': True, 'changes': []}
+    oldest = db.session.query(func.min(ChangeLog.seq)).scalar()
+    if since is None or since > result['seq'] or (oldest is not None and since < oldest - 1):
+        return result
+
+    query = ChangeLog.query.filter(ChangeLog.seq > since)
+    if user_type == 'student':
+        enrolled = select(enrollments.c.class_id).where(enrollments.c.student_id == user_id)
+        query = query.filter(or_(
+            ChangeLog.student_id == user_id,
+            and_(ChangeLog.entity != 'enrollment', ChangeLog.class_id.in_(enrolled))
+        ))
+    else:
+        query = query.filter(ChangeLog.professor_id == user_id)
+    rows = query.order_by(ChangeLog.seq).limit(SYNC_MAX_CHANGES + 1).all()
+
+    if len(rows) > SYNC_MAX_CHANGES:
+        # Cheaper to reload the full list than to replay this many changes
+        return result
+    result.update({
+        'seq': max(result['seq'], rows[-1].seq if rows else 0),
+        'reset': False,
+        'changes': serialize_changes(rows, user_type)
+    })
+    return result
+
+@app.route('/api/sync')
+def sync_changes():
+    """Changes visible to the current user since the given sequence number."""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify(sync_payload(session.get('user_type'), session.get('user_id'),
+                                request.args.get('since', type=int)))
 
 @app.route('/forgot-password', methods=['GET', 'POST'])
 def forgot_password():
@@ -265,19 +1275,19 @@ def forgot_password():
         
         print(f"Password reset request - Email: {email}, User Type: {user_type}")
         
-        if not email or not user_type:
-            flash("Please provide email and select user type")
+        if not email:
+            flash("Please provide your email")
             return redirect(url_for('forgot_password'))
         
-        # Check if user exists
-        if user_type == 'student':
-            user = Student.query.filter_by(username=email).first()
-        else:
-            user = Professor.query.filter_by(username=email).first()
+        # The identity decides the role; the submitted user type is not trusted
+        identity = find_identity(email)
+        user = identity.account() if identity else None
         
         print(f"User found: {user}")
         
         if user:
+            user_type = identity.user_type
+            email = user.username
             # Generate reset token
             token = generate_reset_token()
             expires_at = datetime.utcnow() + timedelta(hours=1)
@@ -290,14 +1300,27 @@ def forgot_password():
                 expires_at=expires_at
             )
             
+            reset_link = email_link('verify_identity', token=token)
+            
             try:
                 db.session.add(reset_token)
+                # The email is committed with the token and delivered in the background
+                queue_email(email, "Reset your LearnSync password",
+                            f"Hello {user.first_name},\n\n"
+                            f"Use the link below to reset your password. It expires in one hour.\n\n"
+                            f"{reset_link}\n\n"
+                            f"If you did not request this, you can ignore this email.")
                 db.session.commit()
+                wake_mail_worker()
                 print(f"✓ Reset token created for {email}: {token}")
                 
-                # For development: Redirect directly to verification page
-                flash("Reset link generated! You can now verify your identity.")
-                return redirect(url_for('verify_identity', token=token))
+                if app.config['PASSWORD_RESET_DEV_REDIRECT']:
+                    # For development: Redirect directly to verification page
+                    flash("Reset link generated! You can now verify your identity.")
+                    return redirect(url_for('verify_identity', token=token))
+                
+                flash("A password reset link has been sent to your email.")
+                return redirect(url_for('login'))
                 
             except Exception as e:
                 print(f"❌ Error generating reset token: {e}")
@@ -324,12 +1347,9 @@ def verify_identity(token):
         return redirect(url_for('forgot_password'))
     
     # Get user information for verification
-    if reset_token.user_type == 'student':
-        user = Student.query.filter_by(username=reset_token.email).first()
-        user_type_name = "Student"
-    else:
-        user = Professor.query.filter_by(username=reset_token.email).first()
-        user_type_name = "Professor"
+    identity = find_identity(reset_token.email)
+    user = identity.account() if identity and identity.user_type == reset_token.user_type else None
+    user_type_name = "Student" if reset_token.user_type == 'student' else "Professor"
     
     if not user:
         flash("User not found.")
@@ -397,11 +1417,9 @@ def reset_password(token):
             flash("Password must be at least 6 characters long!")
             return render_template('reset_password.html', token=token)
         
-        # Update user password
-        if reset_token.user_type == 'student':
-            user = Student.query.filter_by(username=reset_token.email).first()
-        else:
-            user = Professor.query.filter_by(username=reset_token.email).first()
+        # Update user password (the identity's copy of the hash follows in the same commit)
+        identity = find_identity(reset_token.email)
+        user = identity.account() if identity and identity.user_type == reset_token.user_type else None
         
         if user:
             try:
@@ -420,61 +1438,358 @@ def reset_password(token):
     
     return render_template('reset_password.html', token=token)
 
-@app.route('/debug/database')
-def debug_database():
-    """Debug route to check database structure and data"""
-    from sqlalchemy import inspect
-    
-    inspector = inspect(db.engine)
-    tables = inspector.get_table_names()
-    
-    result = {
-        'tables': tables,
-        'table_details': {},
-        'data': {}
-    }
-    
-    for table_name in tables:
-        # Get table structure
-        columns = inspector.get_columns(table_name)
-        result['table_details'][table_name] = [
-            {'name': col['name'], 'type': str(col['type'])} 
-            for col in columns
-        ]
-        
-        # Get table data
-        if table_name == 'student':
-            students = Student.query.all()
-            result['data'][table_name] = [
-                {'id': s.id, 'username': s.username, 'first_name': s.first_name, 
-                 'last_name': s.last_name, 'student_id': s.student_id} 
-                for s in students
-            ]
-        elif table_name == 'professor':
-            professors = Professor.query.all()
-            result['data'][table_name] = [
-                {'id': p.id, 'username': p.username, 'first_name': p.first_name,
-                 'last_name': p.last_name, 'professor_id': p.professor_id}
-                for p in professors
-            ]
-        elif table_name == 'password_reset_token':
-            tokens = PasswordResetToken.query.all()
-            result['data'][table_name] = [
-                {'id': t.id, 'email': t.email, 'token': t.token, 
-                 'user_type': t.user_type, 'used': t.used}
-                for t in tokens
-            ]
-    
-    return result
+# --- ADDED: Admin access ---
+# Admins are listed by email in ADMIN_EMAILS (comma-separated) or authenticate
+# scripts with the X-Admin-Token header matching ADMIN_TOKEN.
+def is_admin():
+    token = app.config['ADMIN_TOKEN']
+    if token and hmac.compare_digest(request.headers.get('X-Admin-Token', ''), token):
+        return True
+    return 'user_id' in session and session.get('user_email') in app.config['ADMIN_EMAILS']
 
-@app.route('/debug/clear-tokens')
-def clear_tokens():
-    """Debug route to clear all reset tokens"""
-    try:
-        PasswordResetToken.query.delete()
-        db.session.commit()
-        return "All reset tokens cleared successfully!"
-    except Exception as e:
+# --- ADDED: Streaming admin export (replaces /debug/database) ---
+# Each table is streamed as NDJSON, one row per line.  Rows are read in
+# keyset-paginated chunks ordered by primary key, each chunk its own short
+# query whose rows are serialized as they are read, so memory stays flat
+# and no long read transaction blocks writers.  The last line is a cursor record; pass its
+# value back as ?after= to resume an interrupted export.
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_EXCLUDED_COLUMNS = {'password', 'token'}
+# Queued mail bodies carry live password-reset links
+EXPORT_EXCLUDED_TABLES = {'outbound_email'}
+
+def export_tables():
+    return {name: table for name, table in db.metadata.tables.items() if name not in EXPORT_EXCLUDED_TABLES}
+
+def export_columns(table):
+    return [col for col in table.columns if col.name not in EXPORT_EXCLUDED_COLUMNS]
+
+def export_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+def iter_table_ndjson(engine, table, after):
+    pk = list(table.primary_key.columns)
+    columns = export_columns(table)
+    last = after
+    exported = 0
+    while True:
+        query = select(*columns).order_by(*pk).limit(EXPORT_CHUNK_SIZE)
+        if last is not None:
+            # Keyset condition; composite keys use a row-value comparison
+            if len(pk) > 1:
+                query = query.where(tuple_(*pk) > tuple_(*[literal(v) for v in last]))
+            else:
+                query = query.where(pk[0] > last[0])
+        # Rows are serialized as the cursor yields them; the connection is
+        # released before the chunk is sent so no read transaction spans a yield
+        lines = []
+        with engine.connect() as conn:
+            for row in conn.execute(query).mappings():
+                lines.append(json.dumps({c.name: export_value(row[c.name]) for c in columns}))
+                last = [row[c.name] for c in pk]
+        if not lines:
+            break
+        yield '\n'.join(lines) + '\n'
+        exported += len(lines)
+        if len(lines) < EXPORT_CHUNK_SIZE:
+            break
+    yield json.dumps({'_cursor': ','.join(str(v) for v in last) if last else None,
+                      '_rows': exported}) + '\n'
+
+@app.route('/admin/export')
+def admin_export_index():
+    """Lists the tables available for export"""
+    if not is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    return jsonify({
+        name: url_for('admin_export_table', table_name=name)
+        for name in sorted(export_tables())
+    })
+
+@app.route('/admin/export/<table_name>')
+def admin_export_table(table_name):
+    """Streams one table as NDJSON; ?after=<pk>[,<pk>] resumes after a cursor"""
+    if not is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+
+    table = export_tables().get(table_name)
+    if table is None:
+        return jsonify({'error': 'Unknown table'}), 404
+
+    after = None
+    if request.args.get('after'):
+        pk = list(table.primary_key.columns)
+        parts = request.args['after'].split(',')
+        if len(parts) != len(pk):
+            return jsonify({'error': f'Cursor must have {len(pk)} value(s)'}), 400
+        try:
+            after = [int(v) if isinstance(c.type, db.Integer) else v for c, v in zip(pk, parts)]
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+    engine = db.engine
+    response = app.response_class(iter_table_ndjson(engine, table, after),
+                                  mimetype='application/x-ndjson')
+    response.headers['Content-Disposition'] = f'attachment; filename={table_name}.ndjson'
+    return response
+
+# --- ADDED: Health and diagnostics (replaces /debug/api-check) ---
+@app.route('/health')
+def health():
+    """Liveness/readiness probe: a single trivial query"""
+    try:
+        db.session.execute(text('SELECT 1'))
+        return jsonify({'status': 'ok'})
+    except Exception as e:
+        print(f"Health check failed: {e}")
+        return jsonify({'status': 'error'}), 503
+
+@app.route('/admin/diagnostics', methods=['GET', 'POST'])
+def admin_diagnostics():
+    """Approximate row counts from SQLite statistics, never a full table scan.
+
+    Counts come from sqlite_stat1 (maintained by ANALYZE); tables without
+    statistics fall back to MAX(rowid), a single index seek.  POST runs
+    ANALYZE to refresh the statistics.
+    """
+    if not is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+
+    if request.method == 'POST':
+        db.session.execute(text('ANALYZE'))
+        db.session.commit()
+
+    stats = {}
+    has_stats = db.session.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='sqlite_stat1'")).first()
+    if has_stats:
+        for tbl, stat in db.session.execute(text('SELECT tbl, stat FROM sqlite_stat1')):
+            stats.setdefault(tbl, int(stat.split()[0]))
+
+    tables = {}
+    for name in sorted(db.metadata.tables):
+        if name in stats:
+            tables[name] = {'rows': stats[name], 'source': 'sqlite_stat1'}
+        else:
+            max_rowid = db.session.execute(text(f'SELECT MAX(rowid) FROM "{name}"')).scalar()
+            tables[name] = {'rows': max_rowid or 0, 'source': 'max_rowid'}
+
+    page_count = db.session.execute(text('PRAGMA page_count')).scalar()
+    page_size = db.session.execute(text('PRAGMA page_size')).scalar()
+    freelist = db.session.execute(text('PRAGMA freelist_count')).scalar()
+    return jsonify({
+        'tables': tables,
+        'database': {
+            'size_bytes': page_count * page_size,
+            'free_pages': freelist,
+            'journal_mode': db.session.execute(text('PRAGMA journal_mode')).scalar()
+        },
+        'notification_streams': notification_hub.stream_count
+    })
+
+# --- ADDED: Request profiling ---
+# A request is profiled when an admin sends X-Profile: 1, or at random with
+# probability PROFILE_SAMPLE_RATE.  It runs under cProfile while a sampler
+# thread records the request thread's stack every PROFILE_SAMPLE_INTERVAL
+# seconds, and every SQL statement it issues is timed.  Each profile is
+# written to PROFILE_DIR as <id>.prof (pstats, for snakeviz/pstats),
+# <id>.collapsed (one "frame;frame;frame count" line per stack, the input of
+# flamegraph.pl and speedscope) and <id>.json (request, timings and SQL).  Only
+# the newest PROFILE_MAX_ENTRIES profiles are kept.  At most one request per
+# worker is profiled at a time, so sampling never stacks up overhead.  The
+# profile ends with the request, before a streamed body is iterated.
+PROFILE_SAMPLE_INTERVAL = 0.002
+PROFILE_MAX_ENTRIES = 50
+PROFILE_MAX_QUERIES = 500
+PROFILE_FILE_KINDS = {'prof', 'collapsed', 'json'}
+PROFILE_ID_PATTERN = re.compile(r'^\d{13}-[0-9a-f]{6}$')
+
+profile_lock = Lock()
+profile_state = local()  # SQL timings for the request being profiled on this thread
+
+class StackSampler(Thread):
+    """Counts the collapsed stacks of one thread until stopped."""
+
+    def __init__(self, thread_id):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.stacks = {}
+        self.stopped = Event()
+
+    def run(self):
+        while not self.stopped.wait(PROFILE_SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if frames:
+                stack = ';'.join(reversed(frames))
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def profile_before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if getattr(profile_state, 'queries', None) is not None:
+        conn.info.setdefault('profile_query_start', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def profile_after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    queries = getattr(profile_state, 'queries', None)
+    starts = conn.info.get('profile_query_start')
+    if queries is None or not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    if len(queries) < PROFILE_MAX_QUERIES:
+        # Statements only; bound parameters can hold personal data
+        queries.append({'sql': statement, 'ms': round(elapsed * 1000, 3), 'executemany': executemany})
+
+def should_profile():
+    if request.endpoint in ('admin_profiles', 'admin_profile_file', 'serve_static'):
+        return False
+    if request.headers.get('X-Profile') == '1' and is_admin():
+        return True
+    rate = app.config['PROFILE_SAMPLE_RATE']
+    return rate > 0 and random.random() < rate
+
+@app.before_request
+def start_profiling():
+    if not should_profile() or not profile_lock.acquire(blocking=False):
+        return None
+    # finish_profiling only releases the lock once g.profiler is set, so a
+    # failed setup must undo itself or profiling stays off for this worker
+    sampler = None
+    try:
+        g.profile_started = time.perf_counter()
+        sampler = StackSampler(get_ident())
+        sampler.start()
+        profile_state.queries = []
+        profiler = cProfile.Profile()
+        profiler.enable()
+    except Exception as e:
+        if sampler is not None and sampler.is_alive():
+            sampler.stop()
+        profile_state.queries = None
+        profile_lock.release()
+        print(f"❌ Error starting profiler: {e}")
+        return None
+    g.profile_sampler = sampler
+    g.profiler = profiler
+    return None
+
+@app.after_request
+def record_profile_status(response):
+    if 'profiler' in g:
+        g.profile_status = response.status_code
+        g.profile_id = f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:6]}"
+        response.headers['X-Profile-Id'] = g.profile_id
+    return response
+
+@app.teardown_request
+def finish_profiling(error=None):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return
+    try:
+        profiler.disable()
+        duration = time.perf_counter() - g.profile_started
+        g.profile_sampler.stop()
+        queries = profile_state.queries
+        profile_state.queries = None
+        write_profile(g.get('profile_id') or f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:6]}",
+                      profiler, g.profile_sampler.stacks, queries, duration, error)
+    except Exception as e:
+        print(f"❌ Error writing profile: {e}")
+    finally:
+        profile_lock.release()
+
+def write_profile(profile_id, profiler, stacks, queries, duration, error):
+    directory = app.config['PROFILE_DIR']
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, profile_id)
+
+    profiler.dump_stats(base + '.prof')
+    with open(base + '.collapsed', 'w') as f:
+        for stack, count in sorted(stacks.items()):
+            f.write(f"{stack} {count}\n")
+
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(25)
+    with open(base + '.json', 'w') as f:
+        json.dump({
+            'id': profile_id,
+            'created_at': datetime.utcnow().isoformat(),
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'endpoint': request.endpoint,
+            'status': g.get('profile_status', 500),
+            'error': repr(error) if error else None,
+            'user': f"{session.get('user_type')}:{session.get('user_id')}" if 'user_id' in session else None,
+            'duration_ms': round(duration * 1000, 3),
+            'sql_count': len(queries),
+            'sql_ms': round(sum(q['ms'] for q in queries), 3),
+            'samples': sum(stacks.values()),
+            'queries': queries,
+            'top_functions': summary.getvalue()
+        }, f, indent=1)
+
+    # Ring buffer: ids start with a millisecond timestamp, so name order is age order
+    ids = sorted({name.split('.')[0] for name in os.listdir(directory) if PROFILE_ID_PATTERN.match(name.split('.')[0])})
+    for old_id in ids[:-PROFILE_MAX_ENTRIES]:
+        for kind in PROFILE_FILE_KINDS:
+            try:
+                os.remove(os.path.join(directory, f"{old_id}.{kind}"))
+            except FileNotFoundError:
+                pass
+
+@app.route('/admin/profiles')
+def admin_profiles():
+    """Recent request profiles, newest first."""
+    if not is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+
+    directory = app.config['PROFILE_DIR']
+    profiles = []
+    if os.path.isdir(directory):
+        for name in sorted(os.listdir(directory), reverse=True):
+            if not name.endswith('.json') or not PROFILE_ID_PATTERN.match(name[:-5]):
+                continue
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                continue
+            meta.pop('queries', None)
+            meta.pop('top_functions', None)
+            meta['files'] = {kind: url_for('admin_profile_file', profile_id=meta['id'], kind=kind)
+                             for kind in sorted(PROFILE_FILE_KINDS)}
+            profiles.append(meta)
+    return jsonify({'profiles': profiles, 'sample_rate': app.config['PROFILE_SAMPLE_RATE']})
+
+@app.route('/admin/profiles/<profile_id>.<kind>')
+def admin_profile_file(profile_id, kind):
+    if not is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    if kind not in PROFILE_FILE_KINDS or not PROFILE_ID_PATTERN.match(profile_id):
+        return jsonify({'error': 'Profile not found'}), 404
+    if not os.path.exists(os.path.join(app.config['PROFILE_DIR'], f"{profile_id}.{kind}")):
+        return jsonify({'error': 'Profile not found'}), 404
+    return send_from_directory(app.config['PROFILE_DIR'], f"{profile_id}.{kind}", as_attachment=True)
+
+@app.route('/debug/clear-tokens')
+def clear_tokens():
+    """Debug route to clear all reset tokens"""
+    try:
+        PasswordResetToken.query.delete()
+        db.session.commit()
+        return "All reset tokens cleared successfully!"
+    except Exception as e:
         return f"Error clearing tokens: {e}"
 
 @app.route('/signup', methods=['GET', 'POST'])
@@ -504,11 +1819,8 @@ def signup():
             flash("Passwords do not match!")
             return redirect(url_for('signup'))
 
-        # Check if email already exists in either table
-        existing_student = Student.query.filter_by(username=email).first()
-        existing_professor = Professor.query.filter_by(username=email).first()
-        
-        if existing_student or existing_professor:
+        # Check if email already exists for either role
+        if find_identity(email):
             flash("Email already registered!")
             return redirect(url_for('signup'))
 
@@ -567,25 +1879,20 @@ def signup():
                     department=department
                 )
             
+            # The identity row is inserted in the same transaction (see Identity)
             db.session.add(new_user)
             db.session.commit()
             print(f"✓ {user_type.capitalize()} created successfully: {email}")
             print(f"User ID: {new_user.id}")
             
-            # Verify the user was saved
-            if user_type == 'student':
-                saved_user = Student.query.filter_by(username=email).first()
-            else:
-                saved_user = Professor.query.filter_by(username=email).first()
-                
-            if saved_user:
-                print(f"✓ User verified in database: {saved_user}")
-            else:
-                print("❌ User not found in database after creation!")
-            
             flash("Account created successfully! Please log in.")
             return redirect(url_for('login'))
             
+        except IntegrityError:
+            # A concurrent signup claimed the email or ID between the check and the commit
+            db.session.rollback()
+            flash("Email or ID already registered!")
+            return redirect(url_for('signup'))
         except Exception as e:
             print(f"❌ Error creating user: {e}")
             db.session.rollback()
@@ -604,26 +1911,24 @@ def login():
         
         email = request.form.get('email')
         password = request.form.get('password')
-        user_type = request.form.get('userType')
 
-        if not email or not password or not user_type:
+        if not email or not password:
             flash("All fields are required")
             return redirect(url_for('login'))
 
-        # Check in the appropriate table based on user type
-        if user_type == 'student':
-            user = Student.query.filter_by(username=email).first()
-        else:  # professor
-            user = Professor.query.filter_by(username=email).first()
+        # One indexed lookup decides the account and its role; the submitted
+        # user type is no longer needed to pick a table
+        identity = find_identity(email)
 
-        print(f"User found: {user}")
+        print(f"Identity found: {identity}")
         
-        if user and check_password_hash(user.password, password):
+        if identity and check_password_hash(identity.password, password):
+            user = identity.account()
             session['user_id'] = user.id
             session['user_email'] = user.username
             session['user_first_name'] = user.first_name
-            session['user_type'] = user_type
-            print(f"Login successful for: {email} ({user_type})")
+            session['user_type'] = identity.user_type
+            print(f"Login successful for: {email} ({identity.user_type})")
             flash("Logged in successfully!")
             return redirect(url_for('dashboard'))
         else:
@@ -651,7 +1956,9 @@ def dashboard():
             return redirect(url_for('logout'))
         print(f"Rendering student dashboard for: {user.first_name}")
         return render_template('student_dashboard.html', 
-                             user=user)
+                             user=user,
+                             bootstrap=bootstrap_payload(user, user_type, since=cached_sync_seq(user_type, user_id))
+                             if app.config['DASHBOARD_BOOTSTRAP'] else None)
     else:  # professor
         user = Professor.query.get(user_id)
         if not user:
@@ -659,7 +1966,9 @@ def dashboard():
             return redirect(url_for('logout'))
         print(f"Rendering professor dashboard for: {user.first_name}")
         return render_template('professor_dashboard.html', 
-                             user=user)
+                             user=user,
+                             bootstrap=bootstrap_payload(user, user_type, since=cached_sync_seq(user_type, user_id))
+                             if app.config['DASHBOARD_BOOTSTRAP'] else None)
 
 @app.route('/logout', methods=['GET', 'POST'])
 def logout():
@@ -696,26 +2005,9 @@ def manage_classes():
 
         if request.method == 'GET':
             try:
-                classes_data = []
                 # FIX 1 (Already applied): Ensure professors only see classes they own by explicitly filtering by their ID.
-                classes = Class.query.filter_by(professor_id=user_id).all()
-                for cls in classes:
-                    students_list = [{
-                        'id': student.student_id,
-                        'name': f"{student.first_name} {student.last_name}",
-                        'email': student.username
-                    } for student in cls.students]
-                    
-                    classes_data.append({
-                        'id': str(cls.id),
-                        'name': cls.name,
-                        'description': cls.description,
-                        'code': cls.code,
-                        'students': students_list,
-                        'materials': [], 
-                        'assignments': [] 
-                    })
-                return jsonify(classes_data)
+                seq = latest_change_seq()  # read first, so racing changes are replayed by /api/sync
+                return with_sync_headers(jsonify(professor_classes_payload(user_id)), seq, user_type, user_id)
             except Exception as e:
                 print(f"Error fetching professor classes: {e}")
                 return jsonify({'error': 'Failed to fetch classes'}), 500
@@ -740,6 +2032,8 @@ def manage_classes():
                     professor_id=user_id
                 )
                 db.session.add(new_class)
+                db.session.flush()
+                record_change('class', 'upsert', new_class.id, new_class)
                 db.session.commit()
                 
                 return jsonify({
@@ -774,15 +2068,13 @@ def manage_classes():
                 if not cls:
                     return jsonify({'error': 'Class not found or you do not have permission to delete it'}), 404
                 
-                # Remove all student enrollments first (good practice)
-                cls.students = []
-                db.session.commit()
-                
-                # Then delete the class
-                db.session.delete(cls)
+                # Large classes are torn down in batches by a background job
+                job = enqueue_job('delete_class', {'class_id': class_id_int},
+                                  owner_type='professor', owner_id=user_id)
                 db.session.commit()
+                wake_job_runner()
                 
-                return jsonify({'message': 'Class deleted successfully'}), 200
+                return jsonify({'message': 'Class deletion started', 'job_id': job.id}), 202
             except ValueError:
                 return jsonify({'error': 'Invalid class ID format'}), 400
             except Exception as e:
@@ -803,19 +2095,11 @@ def manage_classes():
             return jsonify({'error': 'Student not found'}), 404
         
         try:
-            classes_data = []
             # FIX 3 (Enrollment Bug Check): Student's enrolled classes are correctly filtered via the many-to-many relationship.
             # This is the correct logic for students to ONLY see enrolled classes.
-            for cls in student.classes:
-                professor = Professor.query.get(cls.professor_id)
-                classes_data.append({
-                    'id': str(cls.id),
-                    'name': cls.name,
-                    'description': cls.description,
-                    'code': cls.code,
-                    'professor_name': f"{professor.first_name} {professor.last_name}" if professor else "N/A"
-                })
-            return jsonify(classes_data)
+            seq = latest_change_seq()  # read first, so racing changes are replayed by /api/sync
+            classes_data = student_classes_payload(student)
+            return with_sync_headers(jsonify(classes_data), seq, user_type, user_id)
         except Exception as e:
             print(f"Error fetching student classes: {e}")
             return jsonify({'error': 'Failed to fetch classes'}), 500
@@ -852,9 +2136,14 @@ def join_class():
 
     try:
         cls_to_join.students.append(student)
+        bump_gradebook_version(cls_to_join.id)
+        record_change('enrollment', 'upsert', student.id, cls_to_join, student_id=student.id)
         db.session.commit()
         
         professor = Professor.query.get(cls_to_join.professor_id)
+        notify_users([('professor', cls_to_join.professor_id)], 'enrollment',
+                     f"{student.first_name} {student.last_name} joined {cls_to_join.name}",
+                     class_id=cls_to_join.id)
         
         return jsonify({
             'message': 'Successfully joined class!',
@@ -905,6 +2194,8 @@ def unenroll_class():
 
     try:
         cls_to_leave.students.remove(student)
+        bump_gradebook_version(cls_to_leave.id)
+        record_change('enrollment', 'delete', student.id, cls_to_leave, student_id=student.id)
         db.session.commit()
         
         return jsonify({
@@ -932,6 +2223,8 @@ def debug_enroll(student_id_str, class_code_str):
             return f"Student {student.first_name} is already enrolled in {cls.name}."
         
         cls.students.append(student)
+        bump_gradebook_version(cls.id)
+        record_change('enrollment', 'upsert', student.id, cls, student_id=student.id)
         db.session.commit()
         return f"Successfully enrolled student {student.first_name} in class {cls.name}."
     except Exception as e:
@@ -952,12 +2245,7 @@ def student_stats():
         return {'error': 'Student not found'}, 404
     
     # Return actual data where available
-    return {
-        'enrolled_classes': len(student.classes),
-        'pending_assignments': 0, # Mocked for now
-        'upcoming_deadlines': 0, # Mocked for now
-        'completed_assignments': 0 # Mocked for now
-    }
+    return student_stats_payload(student)
 
 @app.route('/api/professor/stats')
 def professor_stats():
@@ -971,16 +2259,8 @@ def professor_stats():
     if not professor:
         return {'error': 'Professor not found'}, 404
     
-    # Calculate total students across all classes for this professor
-    total_students = sum(len(c.students) for c in professor.classes)
-    
-    # Return actual data where available
-    return {
-        'total_classes': len(professor.classes),
-        'total_students': total_students,
-        'pending_tasks': 0, # Mocked for now
-        'upcoming_deadlines': 0 # Mocked for now
-    }
+    # Totals come from COUNT queries instead of loading every roster
+    return professor_stats_payload(professor_id)
 
 @app.route('/api/profile/update-password', methods=['POST'])
 def update_password():
@@ -1012,6 +2292,1872 @@ def update_password():
         db.session.rollback()
         return {'error': 'Failed to update password'}, 500
 
+# --- ADDED: Server-Sent Events notifications ---
+# Each worker keeps an in-process hub mapping (user_type, user_id) to the queues
+# of that user's open streams.  Notifications are written to the event log first
+# and then published, so a stream that misses a live event (reconnect, another
+# worker) picks it up from the log via Last-Event-ID.
+SSE_HEARTBEAT_SECONDS = 15
+SSE_MAX_STREAMS_PER_WORKER = 100
+SSE_QUEUE_SIZE = 100
+NOTIFICATION_LOG_MAX_ROWS = 50000
+NOTIFICATION_REPLAY_LIMIT = 100
+
+class NotificationHub:
+    """In-process pub/sub for notification streams."""
+
+    def __init__(self, max_streams):
+        self.max_streams = max_streams
+        self.subscribers = {}
+        self.stream_count = 0
+        self.lock = Lock()
+
+    def subscribe(self, key):
+        """Registers a new stream, or returns None when the worker is at capacity."""
+        with self.lock:
+            if self.stream_count >= self.max_streams:
+                return None
+            q = queue.Queue(maxsize=SSE_QUEUE_SIZE)
+            self.subscribers.setdefault(key, set()).add(q)
+            self.stream_count += 1
+            return q
+
+    def unsubscribe(self, key, q):
+        with self.lock:
+            streams = self.subscribers.get(key)
+            if streams and q in streams:
+                streams.discard(q)
+                self.stream_count -= 1
+                if not streams:
+                    del self.subscribers[key]
+
+    def publish(self, key, event):
+        with self.lock:
+            streams = list(self.subscribers.get(key, ()))
+        for q in streams:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                # Slow consumer: it will catch up from the log when it reconnects
+                pass
+
+notification_hub = NotificationHub(SSE_MAX_STREAMS_PER_WORKER)
+
+def notify_users(recipients, kind, message, class_id=None):
+    """Writes one notification per (user_type, user_id) and publishes them to open streams."""
+    recipients = list(recipients)
+    if not recipients:
+        return
+    try:
+        rows = [Notification(user_type=user_type, user_id=user_id, kind=kind,
+                             message=message[:300], class_id=class_id)
+                for user_type, user_id in recipients]
+        db.session.add_all(rows)
+        db.session.flush()
+        # Serialize while the rows are still loaded; commit expires them
+        events = [((row.user_type, row.user_id), row.to_dict()) for row in rows]
+
+        # Keep the log bounded; ids are monotonic so this is a primary key range delete
+        Notification.query.filter(
+            Notification.id <= events[-1][1]['id'] - NOTIFICATION_LOG_MAX_ROWS
+        ).delete(synchronize_session=False)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error writing notifications: {e}")
+        return
+
+    for key, event in events:
+        notification_hub.publish(key, event)
+
+def notify_class_students(class_id, kind, message):
+    """Fans a notification out to every student enrolled in a class."""
+    student_ids = [row.student_id for row in db.session.query(enrollments.c.student_id)
+                   .filter(enrollments.c.class_id == class_id)]
+    notify_users([('student', sid) for sid in student_ids], kind, message, class_id=class_id)
+
+def format_sse(event):
+    return f"id: {event['id']}\nevent: notification\ndata: {json.dumps(event)}\n\n"
+
+@app.route('/api/notifications')
+def list_notifications():
+    """Most recent notifications for the bell dropdown."""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    rows = Notification.query.filter_by(
+        user_type=session.get('user_type'), user_id=session['user_id']
+    ).order_by(Notification.id.desc()).limit(20).all()
+    return jsonify([row.to_dict() for row in rows])
+
+@app.route('/api/notifications/stream')
+def notification_stream():
+    """SSE stream of the current user's notifications."""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    key = (session.get('user_type'), session['user_id'])
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    q = notification_hub.subscribe(key)
+    if q is None:
+        response = jsonify({'error': 'Too many open notification streams, retry later'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(SSE_HEARTBEAT_SECONDS)
+        return response
+
+    # Subscribe before reading the log so nothing published in between is lost;
+    # the slot is given back if the stream never gets to start
+    try:
+        backlog = []
+        if last_event_id is not None:
+            backlog = [row.to_dict() for row in Notification.query.filter(
+                Notification.user_type == key[0],
+                Notification.user_id == key[1],
+                Notification.id > last_event_id
+            ).order_by(Notification.id).limit(NOTIFICATION_REPLAY_LIMIT)]
+        db.session.remove()
+    except Exception:
+        notification_hub.unsubscribe(key, q)
+        raise
+
+    def generate():
+        sent_up_to = last_event_id or 0
+        try:
+            yield f"retry: {SSE_HEARTBEAT_SECONDS * 1000}\n\n"
+            for event in backlog:
+                sent_up_to = event['id']
+                yield format_sse(event)
+            while True:
+                try:
+                    event = q.get(timeout=SSE_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": heartbeat\n\n"
+                    continue
+                if event['id'] <= sent_up_to:
+                    continue
+                sent_up_to = event['id']
+                yield format_sse(event)
+        finally:
+            notification_hub.unsubscribe(key, q)
+
+    response = app.response_class(generate(), mimetype='text/event-stream')
+    # A generator closed before its first iteration never runs its finally block
+    response.call_on_close(lambda: notification_hub.unsubscribe(key, q))
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# --- ADDED: Asynchronous outbound email ---
+# queue_email() only adds rows to the caller's session, so mail is committed
+# atomically with whatever triggered it.  A background MailWorker claims due
+# rows with a single UPDATE, delivers them over one reused SMTP connection and
+# reschedules failures with exponential backoff.
+MAIL_BATCH_SIZE = 50
+MAIL_CLAIM_SIZE = 20
+MAIL_MAX_ATTEMPTS = 5
+MAIL_BACKOFF_SECONDS = 30
+MAIL_IDLE_TIMEOUT_SECONDS = 30
+MAIL_STALE_CLAIM_MINUTES = 10
+MAIL_POLL_SECONDS = 10
+
+def email_link(endpoint, **values):
+    """Absolute URL for an emailed link, rooted at APP_BASE_URL."""
+    return app.config['APP_BASE_URL'] + url_for(endpoint, **values)
+
+def queue_email(recipients, subject, body, batch=False):
+    """Adds outbound mail to the current session; call wake_mail_worker() after commit."""
+    if isinstance(recipients, str):
+        recipients = [recipients]
+    recipients = [r for r in recipients if r]
+    if not batch:
+        for recipient in recipients:
+            db.session.add(OutboundEmail(recipients=recipient, subject=subject, body=body))
+        return
+    for i in range(0, len(recipients), MAIL_BATCH_SIZE):
+        db.session.add(OutboundEmail(recipients=','.join(recipients[i:i + MAIL_BATCH_SIZE]),
+                                     subject=subject, body=body, is_batch=True))
+
+class MailWorker(Thread):
+    """Daemon thread draining the outbound_email table."""
+
+    def __init__(self):
+        super().__init__(name='mail-worker', daemon=True)
+        self.wakeup = Event()
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.smtp = None
+        self.smtp_last_used = None
+
+    def wake(self):
+        self.wakeup.set()
+
+    def run(self):
+        while True:
+            try:
+                with app.app_context():
+                    delivered = self.drain()
+            except Exception as e:
+                print(f"❌ Mail worker error: {e}")
+                delivered = 0
+            if not delivered:
+                self.close_if_idle()
+                self.wakeup.wait(MAIL_POLL_SECONDS)
+                self.wakeup.clear()
+
+    def claim(self):
+        now = datetime.utcnow()
+        stale = now - timedelta(minutes=MAIL_STALE_CLAIM_MINUTES)
+        due_ids = db.session.query(OutboundEmail.id).filter(
+            or_(
+                and_(OutboundEmail.status == 'pending', OutboundEmail.next_attempt_at <= now),
+                and_(OutboundEmail.status == 'sending', OutboundEmail.claimed_at < stale)
+            )
+        ).order_by(OutboundEmail.id).limit(MAIL_CLAIM_SIZE)
+        # Atomic claim: another worker's concurrent UPDATE cannot grab the same rows
+        OutboundEmail.query.filter(
+            OutboundEmail.id.in_(due_ids.scalar_subquery()),
+            OutboundEmail.status.in_(['pending', 'sending'])
+        ).update({'status': 'sending', 'claimed_by': self.worker_id, 'claimed_at': now},
+                 synchronize_session=False)
+        db.session.commit()
+        return OutboundEmail.query.filter_by(status='sending', claimed_by=self.worker_id).all()
+
+    def drain(self):
+        messages = self.claim()
+        for message in messages:
+            try:
+                self.send(message)
+                message.status = 'sent'
+                message.sent_at = datetime.utcnow()
+                message.last_error = None
+            except Exception as e:
+                self.disconnect()
+                message.attempts += 1
+                message.last_error = str(e)[:300]
+                if message.attempts >= MAIL_MAX_ATTEMPTS:
+                    message.status = 'failed'
+                    print(f"❌ Giving up on email {message.id}: {e}")
+                else:
+                    message.status = 'pending'
+                    delay = MAIL_BACKOFF_SECONDS * (2 ** (message.attempts - 1))
+                    message.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+            message.claimed_by = None
+            db.session.commit()
+        return len(messages)
+
+    def connect(self):
+        if self.smtp is None:
+            smtp = smtplib.SMTP(app.config['MAIL_SERVER'], app.config['MAIL_PORT'], timeout=30)
+            if app.config['MAIL_USE_TLS']:
+                smtp.starttls()
+            if app.config['MAIL_USERNAME']:
+                smtp.login(app.config['MAIL_USERNAME'], app.config['MAIL_PASSWORD'])
+            self.smtp = smtp
+        return self.smtp
+
+    def disconnect(self):
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except Exception:
+                pass
+            self.smtp = None
+
+    def close_if_idle(self):
+        if self.smtp is not None and self.smtp_last_used and \
+                (datetime.utcnow() - self.smtp_last_used).total_seconds() > MAIL_IDLE_TIMEOUT_SECONDS:
+            self.disconnect()
+
+    def send(self, message):
+        recipients = message.recipients.split(',')
+        msg = MIMEMultipart()
+        msg['From'] = app.config['MAIL_SENDER']
+        # Batched announcements go out as Bcc so recipients don't see each other
+        msg['To'] = app.config['MAIL_SENDER'] if message.is_batch else recipients[0]
+        msg['Subject'] = message.subject
+        msg.attach(MIMEText(message.body, 'plain', 'utf-8'))
+        try:
+            self.connect().send_message(msg, to_addrs=recipients)
+        except smtplib.SMTPServerDisconnected:
+            # The reused connection went stale; reconnect once
+            self.smtp = None
+            self.connect().send_message(msg, to_addrs=recipients)
+        self.smtp_last_used = datetime.utcnow()
+
+mail_worker = None
+mail_worker_lock = Lock()
+
+def wake_mail_worker():
+    """Starts the mail worker on first use and nudges it to drain the queue now."""
+    global mail_worker
+    if not app.config['MAIL_WORKER_ENABLED']:
+        return
+    with mail_worker_lock:
+        if mail_worker is None or not mail_worker.is_alive():
+            mail_worker = MailWorker()
+            mail_worker.start()
+    mail_worker.wake()
+
+# --- ADDED: Background job runner ---
+# Heavy operations run on a dedicated pool of JOB_WORKERS threads, separate
+# from the request threads.  Each job type is registered with @job_handler and
+# a concurrency limit that holds across all workers: the claim UPDATE only
+# picks a queued job whose type has fewer than its limit running.  Handlers
+# receive a JobContext for progress reporting and cooperative cancellation.
+JOB_POLL_SECONDS = 5
+JOB_STALE_MINUTES = 15
+
+job_types = {}
+
+class JobCancelled(Exception):
+    """Raised inside a handler when its job has been cancelled."""
+
+def job_handler(job_type, max_concurrency=1):
+    def register(func):
+        job_types[job_type] = {'handler': func, 'max_concurrency': max_concurrency}
+        return func
+    return register
+
+def enqueue_job(job_type, payload=None, owner_type=None, owner_id=None):
+    """Adds a job to the current session; call wake_job_runner() after commit."""
+    if job_type not in job_types:
+        raise ValueError(f"Unknown job type: {job_type}")
+    job = Job(job_type=job_type, payload=json.dumps(payload or {}),
+              owner_type=owner_type, owner_id=owner_id)
+    db.session.add(job)
+    return job
+
+class JobContext:
+    def __init__(self, job_id):
+        self.job_id = job_id
+
+    def progress(self, percent, message=None):
+        """Records progress and raises JobCancelled if cancellation was requested."""
+        updated = Job.query.filter_by(id=self.job_id, cancel_requested=False).update({
+            'progress': max(0, min(100, int(percent))),
+            'progress_message': message[:200] if message else None,
+            'heartbeat_at': datetime.utcnow()
+        }, synchronize_session=False)
+        db.session.commit()
+        if not updated:
+            raise JobCancelled()
+
+class JobRunner:
+    """Pool of worker threads claiming jobs from the job table."""
+
+    def __init__(self, size):
+        self.size = size
+        self.wakeup = Event()
+        self.threads = []
+
+    def start(self):
+        for i in range(self.size):
+            thread = Thread(target=self.work, name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def is_alive(self):
+        return any(thread.is_alive() for thread in self.threads)
+
+    def wake(self):
+        self.wakeup.set()
+
+    def work(self):
+        while True:
+            try:
+                with app.app_context():
+                    ran = self.run_next()
+            except Exception as e:
+                print(f"❌ Job worker error: {e}")
+                ran = False
+            if not ran:
+                self.wakeup.wait(JOB_POLL_SECONDS)
+                self.wakeup.clear()
+
+    def claim(self):
+        """Atomically moves one eligible queued job to running; returns its id."""
+        if not job_types:
+            return None
+        now = datetime.utcnow()
+
+        # Jobs whose worker stopped heart-beating go back to the queue
+        Job.query.filter(
+            Job.status == 'running',
+            Job.heartbeat_at < now - timedelta(minutes=JOB_STALE_MINUTES)
+        ).update({'status': 'queued', 'claimed_by': None}, synchronize_session=False)
+
+        candidate = aliased(Job)
+        running = aliased(Job)
+        running_count = select(func.count(running.id)).where(
+            running.status == 'running', running.job_type == candidate.job_type
+        ).scalar_subquery()
+        limit = case({name: spec['max_concurrency'] for name, spec in job_types.items()},
+                     value=candidate.job_type, else_=0)
+        next_id = select(candidate.id).where(
+            candidate.status == 'queued', running_count < limit
+        ).order_by(candidate.id).limit(1).scalar_subquery()
+
+        token = uuid.uuid4().hex
+        claimed = Job.query.filter(Job.id == next_id, Job.status == 'queued').update({
+            'status': 'running', 'claimed_by': token, 'started_at': now, 'heartbeat_at': now
+        }, synchronize_session=False)
+        db.session.commit()
+        if not claimed:
+            return None
+        return db.session.query(Job.id).filter_by(claimed_by=token).scalar()
+
+    def run_next(self):
+        job_id = self.claim()
+        if job_id is None:
+            return False
+
+        job = Job.query.get(job_id)
+        spec = job_types[job.job_type]
+        payload = json.loads(job.payload or '{}')
+        try:
+            result = spec['handler'](JobContext(job_id), payload)
+            status, error = 'succeeded', None
+        except JobCancelled:
+            db.session.rollback()
+            result, status, error = None, 'cancelled', None
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Job {job_id} ({job.job_type}) failed: {e}")
+            result, status, error = None, 'failed', str(e)[:500]
+
+        values = {'status': status, 'error': error, 'finished_at': datetime.utcnow(),
+                  'result': json.dumps(result) if result is not None else None}
+        if status == 'succeeded':
+            values.update({'progress': 100, 'progress_message': 'Done'})
+        Job.query.filter_by(id=job_id).update(values, synchronize_session=False)
+        db.session.commit()
+        return True
+
+job_runner = None
+job_runner_lock = Lock()
+
+def wake_job_runner():
+    """Starts the worker pool on first use and nudges it to claim work now."""
+    global job_runner
+    if app.config['JOB_WORKERS'] <= 0:
+        return
+    with job_runner_lock:
+        if job_runner is None or not job_runner.is_alive():
+            job_runner = JobRunner(app.config['JOB_WORKERS'])
+            job_runner.start()
+    job_runner.wake()
+
+def can_view_job(job):
+    return is_admin() or (job.owner_type == session.get('user_type')
+                          and job.owner_id == session.get('user_id'))
+
+@app.route('/api/jobs')
+def list_jobs():
+    """The current user's recent jobs."""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    jobs = Job.query.filter_by(owner_type=session.get('user_type'), owner_id=session['user_id']) \
+        .order_by(Job.id.desc()).limit(20).all()
+    return jsonify([job.to_dict() for job in jobs])
+
+@app.route('/api/jobs/<int:job_id>')
+def job_status(job_id):
+    if 'user_id' not in session and not is_admin():
+        return jsonify({'error': 'Unauthorized'}), 401
+    job = Job.query.get(job_id)
+    if not job or not can_view_job(job):
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<int:job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    if 'user_id' not in session and not is_admin():
+        return jsonify({'error': 'Unauthorized'}), 401
+    job = Job.query.get(job_id)
+    if not job or not can_view_job(job):
+        return jsonify({'error': 'Job not found'}), 404
+
+    # Queued jobs are cancelled outright; running ones stop at their next progress report
+    cancelled = Job.query.filter_by(id=job_id, status='queued').update(
+        {'status': 'cancelled', 'cancel_requested': True, 'finished_at': datetime.utcnow()},
+        synchronize_session=False)
+    if not cancelled:
+        Job.query.filter_by(id=job_id, status='running').update(
+            {'cancel_requested': True}, synchronize_session=False)
+    db.session.commit()
+    db.session.refresh(job)
+    return jsonify(job.to_dict()), 202 if job.status == 'running' else 200
+
+CLASS_DELETE_BATCH_SIZE = 500
+
+def delete_in_batches(table, ids):
+    """Deletes the rows of table whose id the ids select returns, one short
+    transaction per CLASS_DELETE_BATCH_SIZE rows, yielding each batch's size.
+
+    When ids also selects a stored path, those upload files are unlinked once
+    the batch that referenced them is committed.
+    """
+    while True:
+        rows = db.session.execute(ids.limit(CLASS_DELETE_BATCH_SIZE)).all()
+        if not rows:
+            return
+        db.session.execute(table.delete().where(table.c.id.in_([row[0] for row in rows])))
+        db.session.commit()
+        remove_upload_files([row[1] for row in rows if len(row) > 1])
+        yield len(rows)
+
+@job_handler('delete_class', max_concurrency=1)
+def run_delete_class(ctx, payload):
+    """Deletes a class in short transactions so the write lock is never held for long."""
+    class_id = payload['class_id']
+    cls = Class.query.get(class_id)
+    if not cls:
+        return {'deleted': False}
+    class_name = cls.name
+
+    # Children before parents, so the class row is deleted with nothing left to cascade
+    assignment_ids = select(Assignment.id).where(Assignment.class_id == class_id)
+    submission_ids = select(Submission.id).where(Submission.assignment_id.in_(assignment_ids))
+    steps = [
+        ('attendance records', AttendanceRecord.__table__,
+         select(AttendanceRecord.id).where(AttendanceRecord.class_id == class_id)),
+        ('attendance sessions', AttendanceSession.__table__,
+         select(AttendanceSession.id).where(AttendanceSession.class_id == class_id)),
+        ('submission files', SubmissionFile.__table__,
+         select(SubmissionFile.id, SubmissionFile.stored_path).where(
+             SubmissionFile.submission_id.in_(submission_ids))),
+        ('submissions', Submission.__table__, submission_ids),
+        ('calendar events', CalendarEvent.__table__,
+         select(CalendarEvent.id).where(or_(CalendarEvent.class_id == class_id,
+                                            CalendarEvent.assignment_id.in_(assignment_ids)))),
+        ('assignments', Assignment.__table__, assignment_ids),
+    ]
+
+    total = db.session.query(func.count()).select_from(enrollments).filter(
+        enrollments.c.class_id == class_id).scalar()
+    step_totals = [db.session.execute(select(func.count()).select_from(ids.subquery())).scalar()
+                   for _, _, ids in steps]
+    total_rows = max(total + sum(step_totals), 1)
+    notify_class_students(class_id, 'class_deleted', f"{class_name} has been deleted by the professor")
+
+    professor_id = cls.professor_id
+    done = 0
+    removed = 0
+    while True:
+        batch = select(enrollments.c.student_id).where(
+            enrollments.c.class_id == class_id).limit(CLASS_DELETE_BATCH_SIZE)
+        # Each removed student sees the class disappear from their change feed
+        db.session.execute(ChangeLog.__table__.insert().from_select(
+            ['entity', 'action', 'entity_id', 'class_id', 'professor_id', 'student_id', 'created_at'],
+            select(literal('enrollment'), literal('delete'), enrollments.c.student_id, literal(class_id),
+                   literal(professor_id), enrollments.c.student_id, literal(datetime.utcnow())).where(
+                enrollments.c.class_id == class_id,
+                enrollments.c.student_id.in_(batch.scalar_subquery()))))
+        result = db.session.execute(enrollments.delete().where(
+            enrollments.c.class_id == class_id,
+            enrollments.c.student_id.in_(batch.scalar_subquery())))
+        db.session.commit()
+        if not result.rowcount:
+            break
+        removed += result.rowcount
+        done += result.rowcount
+        ctx.progress(95 * done / total_rows, f"Removed {removed} of {total} enrollments")
+
+    for (label, table, ids), step_total in zip(steps, step_totals):
+        step_removed = 0
+        for count in delete_in_batches(table, ids):
+            step_removed += count
+            done += count
+            ctx.progress(95 * done / total_rows, f"Removed {step_removed} of {step_total} {label}")
+
+    # Only the class row and its gradebook version are left
+    cls = Class.query.get(class_id)
+    if cls:
+        GradebookVersion.query.filter_by(class_id=class_id).delete(synchronize_session=False)
+        record_change('class', 'delete', class_id, cls)
+        db.session.delete(cls)
+        db.session.commit()
+    with gradebook_cache_lock:
+        gradebook_cache.pop(class_id, None)
+    return {'deleted': True, 'class': class_name, 'enrollments_removed': removed}
+
+@app.route('/api/professor/classes/<int:class_id>', methods=['PUT'])
+def update_class(class_id):
+    """Renames a class or changes its description."""
+    if 'user_id' not in session or session.get('user_type') != 'professor':
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    cls = Class.query.filter_by(id=class_id, professor_id=session['user_id']).first()
+    if not cls:
+        return jsonify({'error': 'Class not found or you do not have permission to edit it'}), 404
+
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'error': 'No JSON data provided'}), 400
+    if 'name' in data:
+        name = (data.get('name') or '').strip()
+        if not name:
+            return jsonify({'error': 'Class name is required'}), 400
+        cls.name = name
+    if 'description' in data:
+        cls.description = data.get('description')
+
+    try:
+        record_change('class', 'upsert', cls.id, cls)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error updating class: {e}")
+        return jsonify({'error': 'Failed to update class'}), 500
+
+    return jsonify({
+        'id': str(cls.id),
+        'name': cls.name,
+        'description': cls.description,
+        'code': cls.code
+    })
+
+@app.route('/api/professor/classes/<int:class_id>', methods=['DELETE'])
+def delete_class(class_id):
+    """REST-style class deletion used by the dashboard (runs as a background job)."""
+    if 'user_id' not in session or session.get('user_type') != 'professor':
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    cls = Class.query.filter_by(id=class_id, professor_id=session['user_id']).first()
+    if not cls:
+        return jsonify({'error': 'Class not found or you do not have permission to delete it'}), 404
+
+    try:
+        job = enqueue_job('delete_class', {'class_id': class_id},
+                          owner_type='professor', owner_id=session['user_id'])
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error deleting class: {e}")
+        return jsonify({'error': 'Failed to delete class'}), 500
+
+    wake_job_runner()
+    return jsonify({'message': 'Class deletion started', 'job_id': job.id}), 202
+
+@job_handler('class_announcement', max_concurrency=2)
+def run_class_announcement(ctx, payload):
+    """Queues batched announcement emails and notifies every enrolled student."""
+    class_id = payload['class_id']
+    cls = Class.query.get(class_id)
+    if not cls:
+        return {'recipients': 0}
+
+    emails = [row.username for row in db.session.query(Student.username)
+              .join(enrollments, enrollments.c.student_id == Student.id)
+              .filter(enrollments.c.class_id == class_id)]
+    ctx.progress(10, f"Emailing {len(emails)} students")
+    queue_email(emails, f"[{cls.name}] {payload['subject'][:150]}", payload['message'], batch=True)
+    db.session.commit()
+    wake_mail_worker()
+
+    ctx.progress(60, "Sending notifications")
+    notify_class_students(class_id, 'announcement', f"{cls.name}: {payload['subject']}")
+    return {'recipients': len(emails)}
+
+@app.route('/api/professor/classes/<int:class_id>/announcements', methods=['POST'])
+def class_announcement(class_id):
+    """Emails and notifies every student enrolled in a class (as a background job)."""
+    if 'user_id' not in session or session.get('user_type') != 'professor':
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    cls = Class.query.get(class_id)
+    if not cls or cls.professor_id != session['user_id']:
+        return jsonify({'error': 'Class not found or you do not have permission to post to it'}), 404
+
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'error': 'No JSON data provided'}), 400
+    subject = (data.get('subject') or '').strip()
+    message = (data.get('message') or '').strip()
+    if not subject or not message:
+        return jsonify({'error': 'Subject and message are required'}), 400
+
+    try:
+        job = enqueue_job('class_announcement',
+                          {'class_id': class_id, 'subject': subject, 'message': message},
+                          owner_type='professor', owner_id=session['user_id'])
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error queueing announcement: {e}")
+        return jsonify({'error': 'Failed to send announcement'}), 500
+
+    wake_job_runner()
+    return jsonify({'message': 'Announcement queued', 'job_id': job.id,
+                    'status_url': url_for('job_status', job_id=job.id)}), 202
+
+# --- ADDED: Assignment routes (deadlines feed the calendar) ---
+def parse_due_date(value):
+    """Parses the dueDate sent by the dashboard (datetime-local or plain date)."""
+    for fmt in ('%Y-%m-%dT%H:%M', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+def assignment_to_dict(assignment):
+    return {
+        'id': str(assignment.id),
+        'title': assignment.title,
+        'description': assignment.description,
+        'instructions': assignment.instructions,
+        'points': assignment.points,
+        'dueDate': assignment.due_date.isoformat(),
+        'dateCreated': assignment.created_at.isoformat() if assignment.created_at else None,
+        'submissions': [],
+        'files': []
+    }
+
+@app.route('/api/professor/classes/<int:class_id>/assignments', methods=['GET', 'POST'])
+def class_assignments(class_id):
+    """API endpoint for listing and creating assignments in a class."""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    user_id = session['user_id']
+    user_type = session.get('user_type')
+
+    cls = Class.query.get(class_id)
+    if not cls:
+        return jsonify({'error': 'Class not found'}), 404
+
+    if request.method == 'GET':
+        if user_type == 'professor':
+            allowed = cls.professor_id == user_id
+        else:
+            allowed = db.session.query(enrollments).filter_by(
+                student_id=user_id, class_id=class_id).first() is not None
+        if not allowed:
+            return jsonify({'error': 'You do not have access to this class'}), 403
+        assignments = Assignment.query.filter_by(class_id=class_id).order_by(Assignment.due_date).all()
+        return jsonify([assignment_to_dict(a) for a in assignments])
+
+    if user_type != 'professor' or cls.professor_id != user_id:
+        return jsonify({'error': 'Only the class professor can create assignments'}), 403
+
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'error': 'No JSON data provided'}), 400
+
+    title = (data.get('title') or '').strip()
+    due_date = parse_due_date(data.get('dueDate'))
+    if not title:
+        return jsonify({'error': 'Assignment title is required'}), 400
+    if not due_date:
+        return jsonify({'error': 'A valid due date is required'}), 400
+
+    try:
+        points = int(data.get('points') or 100)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Points must be a number'}), 400
+
+    try:
+        assignment = Assignment(
+            class_id=class_id,
+            title=title,
+            description=data.get('description'),
+            instructions=data.get('instructions'),
+            points=points,
+            due_date=due_date
+        )
+        # Derived deadline event, written in the same transaction
+        assignment.calendar_event = CalendarEvent(
+            title=f"Due: {title}",
+            event_date=due_date.date(),
+            class_id=class_id,
+            source='assignment'
+        )
+        db.session.add(assignment)
+        bump_gradebook_version(class_id)
+        db.session.flush()
+        record_change('assignment', 'upsert', assignment.id, cls)
+        db.session.commit()
+        notify_class_students(class_id, 'assignment',
+                              f"New assignment in {cls.name}: {title} (due {due_date.strftime('%b %d, %Y')})")
+        return jsonify(assignment_to_dict(assignment)), 201
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error creating assignment: {e}")
+        return jsonify({'error': 'Failed to create assignment'}), 500
+
+# --- ADDED: Assignment submissions ---
+def remove_upload_files(paths):
+    """Deletes stored files, then any directories under UPLOAD_FOLDER they leave empty."""
+    upload_root = os.path.abspath(app.config['UPLOAD_FOLDER'])
+    parents = set()
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"❌ Could not remove upload {path}: {e}")
+        parents.add(os.path.dirname(os.path.abspath(path)))
+    for parent in sorted(parents, key=len, reverse=True):
+        while parent.startswith(upload_root + os.sep):
+            try:
+                os.rmdir(parent)
+            except OSError:
+                break  # not empty, or already gone
+            parent = os.path.dirname(parent)
+
+@app.route('/api/student/assignments/<int:assignment_id>/submission', methods=['POST'])
+def submit_assignment(assignment_id):
+    """Multipart upload of a student's submission (text in 'content', files in 'files')."""
+    if 'user_id' not in session or session.get('user_type') != 'student':
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    student_id = session['user_id']
+    assignment = Assignment.query.get(assignment_id)
+    if not assignment:
+        return jsonify({'error': 'Assignment not found'}), 404
+    enrolled = db.session.query(enrollments).filter_by(
+        student_id=student_id, class_id=assignment.class_id).first()
+    if not enrolled:
+        return jsonify({'error': 'You are not enrolled in this class'}), 403
+
+    content = (request.form.get('content') or '').strip()
+    uploads = [f for f in request.files.getlist('files') if f and f.filename]
+    if not content and not uploads:
+        return jsonify({'error': 'Submission is empty'}), 400
+
+    submission = Submission.query.filter_by(assignment_id=assignment_id, student_id=student_id).first()
+    old_paths = []
+    if submission:
+        # Resubmission replaces the previous files
+        old_paths = [f.stored_path for f in submission.files]
+        submission.files = []
+        submission.submitted_at = datetime.utcnow()
+    else:
+        submission = Submission(assignment_id=assignment_id, student_id=student_id)
+        db.session.add(submission)
+    submission.content = content
+
+    target_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'submissions', str(assignment_id), str(student_id))
+    os.makedirs(target_dir, exist_ok=True)
+    new_paths = []
+    try:
+        for upload in uploads:
+            name = secure_filename(upload.filename) or 'file'
+            path = os.path.join(target_dir, f"{uuid.uuid4().hex}_{name}")
+            upload.save(path)
+            new_paths.append(path)
+            submission.files.append(SubmissionFile(
+                original_name=name, stored_path=path,
+                content_type=upload.mimetype, size=os.path.getsize(path)))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        for path in new_paths:
+            if os.path.exists(path):
+                os.remove(path)
+        print(f"Error saving submission: {e}")
+        return jsonify({'error': 'Failed to save submission'}), 500
+
+    remove_upload_files(old_paths)
+
+    return jsonify({
+        'message': 'Assignment submitted successfully!',
+        'submitted_at': submission.submitted_at.isoformat(),
+        'files': [f.original_name for f in submission.files]
+    }), 201
+
+# --- ADDED: Streaming ZIP of every submission for an assignment ---
+# The archive is produced on the fly: zipfile writes into a tiny in-memory sink
+# that the response generator drains after every chunk, and each stored file
+# is read in ZIP_READ_CHUNK_SIZE pieces.  Neither the archive nor a whole file
+# is ever held in memory or spooled to disk.  Entries are named by student ID
+# and ordered deterministically; the manifest endpoint lists them so an
+# interrupted download can continue with ?after=<student_id>.
+ZIP_READ_CHUNK_SIZE = 64 * 1024
+
+class ZipStreamSink:
+    """Write-only, unseekable file object collecting zipfile output between drains."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def submission_manifest(assignment, after=None):
+    """Deterministic list of archive entries, ordered by student ID then file."""
+    query = Submission.query.join(Student, Student.id == Submission.student_id).options(
+        joinedload(Submission.student), selectinload(Submission.files)
+    ).filter(Submission.assignment_id == assignment.id)
+    if after:
+        query = query.filter(Student.student_id > after)
+    submissions = query.order_by(Student.student_id).all()
+
+    entries = []
+    for submission in submissions:
+        folder = secure_filename(submission.student.student_id or str(submission.student_id)) or str(submission.student_id)
+        if submission.content:
+            entries.append({
+                'name': f"{folder}/submission.txt",
+                'student_id': submission.student.student_id,
+                'size': len(submission.content.encode('utf-8')),
+                'submitted_at': submission.submitted_at,
+                'content': submission.content
+            })
+        for index, stored in enumerate(submission.files, start=1):
+            entry = {
+                'name': f"{folder}/{index:02d}_{stored.original_name}",
+                'student_id': submission.student.student_id,
+                'size': stored.size,
+                'submitted_at': submission.submitted_at,
+                'path': stored.stored_path
+            }
+            if not os.path.exists(stored.stored_path):
+                # Listed in the manifest as missing and left out of the archive
+                print(f"❌ Submission file missing on disk: {stored.stored_path}")
+                entry['missing'] = True
+            entries.append(entry)
+    return entries
+
+def manifest_payload(assignment, entries):
+    public = []
+    for e in entries:
+        item = {'name': e['name'], 'student_id': e['student_id'], 'size': e['size'],
+                'submitted_at': e['submitted_at'].isoformat()}
+        if e.get('missing'):
+            item['missing'] = True
+        public.append(item)
+    version = hashlib.sha1(json.dumps(public, sort_keys=True).encode('utf-8')).hexdigest()
+    return {'assignment_id': str(assignment.id), 'assignment': assignment.title,
+            'version': version, 'entries': public}
+
+def iter_submissions_zip(entries, manifest):
+    sink = ZipStreamSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('manifest.json', json.dumps(manifest, indent=2))
+        yield sink.drain()
+        for entry in entries:
+            if entry.get('missing'):
+                continue
+            source = None
+            if 'path' in entry:
+                try:
+                    source = open(entry['path'], 'rb')
+                except OSError as e:
+                    # Vanished after the manifest was built; never write an empty stand-in
+                    print(f"❌ Skipping submission file {entry['path']}: {e}")
+                    continue
+            info = zipfile.ZipInfo(entry['name'], date_time=entry['submitted_at'].timetuple()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.file_size = entry['size']
+            with archive.open(info, 'w', force_zip64=entry['size'] > zipfile.ZIP64_LIMIT) as dest:
+                if source is None:
+                    dest.write(entry['content'].encode('utf-8'))
+                else:
+                    with source:
+                        while True:
+                            chunk = source.read(ZIP_READ_CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            dest.write(chunk)
+                            data = sink.drain()
+                            if data:
+                                yield data
+            yield sink.drain()
+    # Central directory
+    yield sink.drain()
+
+def professor_assignment_or_error(class_id, assignment_id):
+    if 'user_id' not in session or session.get('user_type') != 'professor':
+        return None, (jsonify({'error': 'Unauthorized'}), 401)
+    assignment = Assignment.query.join(Class).filter(
+        Assignment.id == assignment_id, Assignment.class_id == class_id,
+        Class.professor_id == session['user_id']).first()
+    if not assignment:
+        return None, (jsonify({'error': 'Assignment not found'}), 404)
+    return assignment, None
+
+@app.route('/api/professor/classes/<int:class_id>/assignments/<int:assignment_id>/submissions/manifest')
+def submissions_manifest(class_id, assignment_id):
+    assignment, error = professor_assignment_or_error(class_id, assignment_id)
+    if error:
+        return error
+    entries = submission_manifest(assignment, request.args.get('after'))
+    return jsonify(manifest_payload(assignment, entries))
+
+@app.route('/api/professor/classes/<int:class_id>/assignments/<int:assignment_id>/submissions.zip')
+def download_submissions_zip(class_id, assignment_id):
+    """Streams every submission as a ZIP; ?after=<student_id> resumes after that student."""
+    assignment, error = professor_assignment_or_error(class_id, assignment_id)
+    if error:
+        return error
+
+    after = request.args.get('after')
+    entries = submission_manifest(assignment, after)
+    manifest = manifest_payload(assignment, entries)
+    filename = secure_filename(f"{assignment.title}_submissions") or 'submissions'
+    if after:
+        filename += f"_after_{secure_filename(after)}"
+    # The generator only needs the plain entry dicts; release the connection now
+    db.session.remove()
+
+    response = app.response_class(iter_submissions_zip(entries, manifest), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}.zip"'
+    response.headers['X-Manifest-Version'] = manifest['version']
+    return response
+
+# --- ADDED: Grading ---
+def bump_gradebook_version(class_id):
+    """Increments a class's gradebook version inside the caller's transaction."""
+    updated = GradebookVersion.query.filter_by(class_id=class_id).update(
+        {'version': GradebookVersion.version + 1}, synchronize_session=False)
+    if not updated:
+        db.session.add(GradebookVersion(class_id=class_id, version=1))
+
+@app.route('/api/professor/classes/<int:class_id>/assignments/<int:assignment_id>/submissions/<student_id>',
+           methods=['PUT'])
+def grade_submission(class_id, assignment_id, student_id):
+    """Saves a grade and feedback for one student (student_id is the school ID)."""
+    assignment, error = professor_assignment_or_error(class_id, assignment_id)
+    if error:
+        return error
+
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'error': 'No JSON data provided'}), 400
+    try:
+        grade = float(data.get('grade'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Grade must be a number'}), 400
+    if grade < 0 or grade > (assignment.points or 0):
+        return jsonify({'error': f'Grade must be between 0 and {assignment.points}'}), 400
+
+    student = Student.query.join(enrollments, enrollments.c.student_id == Student.id).filter(
+        Student.student_id == student_id, enrollments.c.class_id == class_id).first()
+    if not student:
+        return jsonify({'error': 'Student is not enrolled in this class'}), 404
+
+    submission = Submission.query.filter_by(assignment_id=assignment_id, student_id=student.id).first()
+    if not submission:
+        # Grading work handed in outside the system
+        submission = Submission(assignment_id=assignment_id, student_id=student.id)
+        db.session.add(submission)
+
+    try:
+        submission.grade = grade
+        submission.feedback = data.get('feedback')
+        submission.graded_at = datetime.utcnow()
+        bump_gradebook_version(class_id)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error saving grade: {e}")
+        return jsonify({'error': 'Failed to save grade'}), 500
+
+    version = db.session.query(GradebookVersion.version).filter_by(class_id=class_id).scalar()
+    apply_grade_change(class_id, version, assignment_id, student.id,
+                       grade / assignment.points * 100 if assignment.points else 0.0)
+    return jsonify({'message': 'Grade saved successfully', 'grade': grade}), 200
+
+# --- ADDED: Grade analytics ---
+# Grades for a class are pulled with one query into a NumPy matrix
+# (assignments x students, as percentages, NaN = ungraded) and cached per
+# worker under the class's gradebook version.  Distributions are computed
+# lazily per assignment and memoised.  A grade saved through this worker
+# updates one cell, drops only that assignment's distribution and recomputes
+# one student's average instead of reloading the class; any other version
+# change (another worker, roster or assignment changes) triggers a reload.
+ANALYTICS_AT_RISK_PERCENT = 60.0
+ANALYTICS_PERCENTILES = (10, 25, 75, 90)
+ANALYTICS_HISTOGRAM_BIN_WIDTH = 10
+
+def grade_distribution(values):
+    """Summary statistics for an array of percentages; NaN entries are ignored."""
+    graded = values[~np.isnan(values)]
+    if graded.size == 0:
+        return {'count': 0}
+    percentiles = np.percentile(graded, ANALYTICS_PERCENTILES)
+    edges = np.arange(0, 100 + ANALYTICS_HISTOGRAM_BIN_WIDTH, ANALYTICS_HISTOGRAM_BIN_WIDTH)
+    histogram, _ = np.histogram(np.clip(graded, 0, 100), bins=edges)
+    return {
+        'count': int(graded.size),
+        'mean': round(float(graded.mean()), 2),
+        'median': round(float(np.median(graded)), 2),
+        'std': round(float(graded.std()), 2),
+        'min': round(float(graded.min()), 2),
+        'max': round(float(graded.max()), 2),
+        'percentiles': {str(p): round(float(v), 2) for p, v in zip(ANALYTICS_PERCENTILES, percentiles)},
+        'histogram': {'bin_width': ANALYTICS_HISTOGRAM_BIN_WIDTH, 'counts': histogram.tolist()}
+    }
+
+def column_averages(matrix):
+    counts = (~np.isnan(matrix)).sum(axis=0)
+    sums = np.nansum(matrix, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+class ClassGradebook:
+    """Cached grade matrix and derived statistics for one class."""
+
+    def __init__(self, version, students, assignment_ids, grades):
+        self.version = version
+        self.students = students  # list of (db id, school id, name)
+        self.student_index = {sid: i for i, (sid, _, _) in enumerate(students)}
+        self.assignment_ids = assignment_ids
+        self.assignment_index = {aid: i for i, aid in enumerate(assignment_ids)}
+        self.grades = grades
+        self.averages = column_averages(grades)
+        self.assignment_stats = {}
+        self.summary = None
+
+    def set_grade(self, assignment_id, student_id, percent):
+        row = self.assignment_index.get(assignment_id)
+        col = self.student_index.get(student_id)
+        if row is None or col is None:
+            return False
+        self.grades[row, col] = percent
+        self.averages[col] = column_averages(self.grades[:, col:col + 1])[0]
+        self.assignment_stats.pop(assignment_id, None)
+        self.summary = None
+        return True
+
+    def assignment_distribution(self, assignment_id):
+        if assignment_id not in self.assignment_stats:
+            row = self.assignment_index[assignment_id]
+            self.assignment_stats[assignment_id] = grade_distribution(self.grades[row])
+        return self.assignment_stats[assignment_id]
+
+    def class_summary(self):
+        if self.summary is None:
+            at_risk_mask = self.averages < ANALYTICS_AT_RISK_PERCENT  # NaN compares False
+            missing = np.isnan(self.grades).sum(axis=0)
+            order = np.argsort(self.averages[at_risk_mask])
+            at_risk = [{
+                'student_id': self.students[i][1],
+                'name': self.students[i][2],
+                'average': round(float(self.averages[i]), 2),
+                'missing': int(missing[i])
+            } for i in np.flatnonzero(at_risk_mask)[order]]
+            self.summary = {
+                'students': len(self.students),
+                'assignments': len(self.assignment_ids),
+                'average_distribution': grade_distribution(self.averages),
+                'at_risk_threshold': ANALYTICS_AT_RISK_PERCENT,
+                'at_risk': at_risk
+            }
+        return self.summary
+
+gradebook_cache = {}
+gradebook_cache_lock = Lock()
+
+def load_gradebook(class_id, version):
+    students = [(row.id, row.student_id, f"{row.first_name} {row.last_name}") for row in
+                db.session.query(Student.id, Student.student_id, Student.first_name, Student.last_name)
+                .join(enrollments, enrollments.c.student_id == Student.id)
+                .filter(enrollments.c.class_id == class_id).order_by(Student.student_id)]
+    assignments = db.session.query(Assignment.id, Assignment.points).filter(
+        Assignment.class_id == class_id).order_by(Assignment.due_date, Assignment.id).all()
+    assignment_ids = [a.id for a in assignments]
+    points = np.array([a.points or 0 for a in assignments], dtype=float)
+
+    grades = np.full((len(assignments), len(students)), np.nan)
+    # Every graded cell for the class in one query, as three columns
+    rows = db.session.query(Submission.assignment_id, Submission.student_id, Submission.grade).join(
+        Assignment, Assignment.id == Submission.assignment_id).filter(
+        Assignment.class_id == class_id, Submission.grade.isnot(None)).all()
+    if rows and students and assignments:
+        student_index = {s[0]: i for i, s in enumerate(students)}
+        assignment_index = {aid: i for i, aid in enumerate(assignment_ids)}
+        a_col = np.array([assignment_index.get(r[0], -1) for r in rows])
+        s_col = np.array([student_index.get(r[1], -1) for r in rows])
+        g_col = np.array([r[2] for r in rows], dtype=float)
+        keep = (a_col >= 0) & (s_col >= 0)  # drop grades of students who left
+        a_col, s_col, g_col = a_col[keep], s_col[keep], g_col[keep]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            grades[a_col, s_col] = np.where(points[a_col] > 0, g_col / points[a_col] * 100, 0.0)
+    return ClassGradebook(version, students, assignment_ids, grades)
+
+def get_gradebook(class_id):
+    version = db.session.query(GradebookVersion.version).filter_by(class_id=class_id).scalar() or 0
+    with gradebook_cache_lock:
+        cached = gradebook_cache.get(class_id)
+        if cached and cached.version == version:
+            return cached
+    gradebook = load_gradebook(class_id, version)
+    with gradebook_cache_lock:
+        gradebook_cache[class_id] = gradebook
+    return gradebook
+
+def apply_grade_change(class_id, version, assignment_id, student_id, percent):
+    """Updates the cached gradebook in place when it is exactly one version behind."""
+    if np is None:
+        return
+    with gradebook_cache_lock:
+        cached = gradebook_cache.get(class_id)
+        if not cached:
+            return
+        if cached.version == version - 1 and cached.set_grade(assignment_id, student_id, percent):
+            cached.version = version
+        else:
+            gradebook_cache.pop(class_id, None)
+
+def analytics_unavailable():
+    return jsonify({'error': 'Grade analytics requires NumPy to be installed'}), 501
+
+@app.route('/api/professor/classes/<int:class_id>/analytics')
+def class_analytics(class_id):
+    """Class-wide average distribution, at-risk students and per-assignment distributions."""
+    if 'user_id' not in session or session.get('user_type') != 'professor':
+        return jsonify({'error': 'Unauthorized'}), 401
+    cls = Class.query.filter_by(id=class_id, professor_id=session['user_id']).first()
+    if not cls:
+        return jsonify({'error': 'Class not found'}), 404
+    if np is None:
+        return analytics_unavailable()
+
+    gradebook = get_gradebook(class_id)
+    with gradebook_cache_lock:
+        summary = dict(gradebook.class_summary())
+        summary['assignments_detail'] = {
+            str(aid): gradebook.assignment_distribution(aid) for aid in gradebook.assignment_ids
+        }
+        summary['gradebook_version'] = gradebook.version
+    return jsonify(summary)
+
+@app.route('/api/professor/classes/<int:class_id>/assignments/<int:assignment_id>/analytics')
+def assignment_analytics(class_id, assignment_id):
+    assignment, error = professor_assignment_or_error(class_id, assignment_id)
+    if error:
+        return error
+    if np is None:
+        return analytics_unavailable()
+
+    gradebook = get_gradebook(class_id)
+    with gradebook_cache_lock:
+        distribution = gradebook.assignment_distribution(assignment_id)
+    return jsonify({'assignment_id': str(assignment_id), 'title': assignment.title,
+                    'points': assignment.points, 'gradebook_version': gradebook.version,
+                    'distribution': distribution})
+
+# --- ADDED: Attendance check-in ---
+# A lecture's check-ins arrive within seconds of each other, so the request
+# path does no writes: it probes the check-in code and the enrollment primary
+# key, then appends to an in-process buffer.  A flusher thread writes the
+# buffer to attendance_record in one transaction per batch (every
+# ATTENDANCE_FLUSH_SECONDS, or sooner once ATTENDANCE_FLUSH_SIZE check-ins are
+# waiting) and refreshes each touched session's present_count in the same
+# transaction.  Repeat check-ins are answered from the buffer's per-session
+# seen set; across workers and restarts the unique (session, student)
+# constraint with INSERT OR IGNORE keeps records idempotent.
+ATTENDANCE_FLUSH_SIZE = 200
+ATTENDANCE_FLUSH_SECONDS = 1
+ATTENDANCE_BUFFER_MAX = 20000
+ATTENDANCE_DEFAULT_MINUTES = 15
+ATTENDANCE_MAX_MINUTES = 240
+
+class AttendanceBuffer:
+    """Pending check-ins for this worker plus the flusher thread that drains them."""
+
+    def __init__(self):
+        self.pending = []
+        self.seen = {}  # session_id -> (closes_at, {student_id, ...})
+        self.lock = Lock()
+        self.flush_lock = Lock()
+        self.wakeup = Event()
+        self.thread = None
+
+    def add(self, attendance_session, student_id):
+        """Buffers a check-in; returns 'checked_in', 'already_checked_in' or None when full."""
+        with self.lock:
+            closes_at, students = self.seen.setdefault(
+                attendance_session.id, (attendance_session.closes_at, set()))
+            if student_id in students:
+                return 'already_checked_in'
+            if len(self.pending) >= ATTENDANCE_BUFFER_MAX:
+                return None
+            students.add(student_id)
+            self.pending.append({
+                'session_id': attendance_session.id,
+                'class_id': attendance_session.class_id,
+                'student_id': student_id,
+                'checked_in_at': datetime.utcnow()
+            })
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = Thread(target=self.run, name='attendance-flusher', daemon=True)
+                self.thread.start()
+            if len(self.pending) >= ATTENDANCE_FLUSH_SIZE:
+                self.wakeup.set()
+        return 'checked_in'
+
+    def run(self):
+        while True:
+            self.wakeup.wait(ATTENDANCE_FLUSH_SECONDS)
+            self.wakeup.clear()
+            try:
+                with app.app_context():
+                    self.flush()
+            except Exception as e:
+                print(f"❌ Attendance flush error: {e}")
+
+    def flush(self):
+        """Writes every buffered check-in in one transaction; returns the number written."""
+        with self.flush_lock:
+            with self.lock:
+                rows, self.pending = self.pending, []
+            if not rows:
+                return 0
+            try:
+                db.session.execute(AttendanceRecord.__table__.insert().prefix_with('OR IGNORE'), rows)
+                for session_id in {row['session_id'] for row in rows}:
+                    present = select(func.count()).select_from(AttendanceRecord).where(
+                        AttendanceRecord.session_id == session_id).scalar_subquery()
+                    AttendanceSession.query.filter_by(id=session_id).update(
+                        {'present_count': present}, synchronize_session=False)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                with self.lock:
+                    # Keep the batch for the next attempt, ahead of newer check-ins
+                    self.pending[:0] = rows
+                raise
+
+            # Sessions that have closed can no longer receive check-ins
+            now = datetime.utcnow()
+            with self.lock:
+                for session_id in [sid for sid, (closes_at, _) in self.seen.items() if closes_at < now]:
+                    del self.seen[session_id]
+            return len(rows)
+
+attendance_buffer = AttendanceBuffer()
+
+@atexit.register
+def flush_attendance_on_exit():
+    with app.app_context():
+        attendance_buffer.flush()
+
+def generate_attendance_code():
+    """Generates a random 6-character check-in code, unique across sessions."""
+    while True:
+        code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+        if not AttendanceSession.query.filter_by(code=code).first():
+            return code
+
+@app.route('/api/student/attendance/check-in', methods=['POST'])
+def attendance_check_in():
+    """Checks the current student in to the session identified by its code."""
+    if 'user_id' not in session or session.get('user_type') != 'student':
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    data = request.get_json(silent=True) or {}
+    code = (data.get('code') or '').strip().upper()
+    if not code:
+        return jsonify({'error': 'Check-in code is required'}), 400
+
+    attendance_session = AttendanceSession.query.filter_by(code=code).first()
+    if not attendance_session:
+        return jsonify({'error': 'Invalid check-in code'}), 404
+    if attendance_session.closes_at <= datetime.utcnow():
+        return jsonify({'error': 'This check-in session has closed'}), 400
+
+    student_id = session['user_id']
+    # Primary-key probe on enrollments (student_id, class_id)
+    enrolled = db.session.query(enrollments.c.student_id).filter_by(
+        student_id=student_id, class_id=attendance_session.class_id).first()
+    if not enrolled:
+        return jsonify({'error': 'You are not enrolled in this class'}), 403
+
+    status = attendance_buffer.add(attendance_session, student_id)
+    if status is None:
+        response = jsonify({'error': 'Too many check-ins right now, please retry'})
+        response.headers['Retry-After'] = str(ATTENDANCE_FLUSH_SECONDS)
+        return response, 503
+    return jsonify({
+        'status': status,
+        'session_id': attendance_session.id,
+        'class_id': attendance_session.class_id
+    }), 202 if status == 'checked_in' else 200
+
+@app.route('/api/professor/classes/<int:class_id>/attendance/sessions', methods=['POST'])
+def open_attendance_session(class_id):
+    """Opens a check-in window for a class and returns its code."""
+    if 'user_id' not in session or session.get('user_type') != 'professor':
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    cls = Class.query.filter_by(id=class_id, professor_id=session['user_id']).first()
+    if not cls:
+        return jsonify({'error': 'Class not found'}), 404
+
+    data = request.get_json(silent=True) or {}
+    try:
+        minutes = int(data.get('minutes') or ATTENDANCE_DEFAULT_MINUTES)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Minutes must be a number'}), 400
+    minutes = max(1, min(minutes, ATTENDANCE_MAX_MINUTES))
+
+    try:
+        now = datetime.utcnow()
+        attendance_session = AttendanceSession(
+            class_id=class_id,
+            code=generate_attendance_code(),
+            opened_at=now,
+            closes_at=now + timedelta(minutes=minutes)
+        )
+        db.session.add(attendance_session)
+        db.session.commit()
+        return jsonify(attendance_session.to_dict()), 201
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error opening attendance session: {e}")
+        return jsonify({'error': 'Failed to open attendance session'}), 500
+
+@app.route('/api/professor/attendance/sessions/<int:session_id>/close', methods=['POST'])
+def close_attendance_session(session_id):
+    if 'user_id' not in session or session.get('user_type') != 'professor':
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    attendance_session = AttendanceSession.query.join(Class).filter(
+        AttendanceSession.id == session_id, Class.professor_id == session['user_id']).first()
+    if not attendance_session:
+        return jsonify({'error': 'Attendance session not found'}), 404
+
+    now = datetime.utcnow()
+    if attendance_session.closes_at > now:
+        attendance_session.closes_at = now
+        db.session.commit()
+    return jsonify(attendance_session.to_dict())
+
+@app.route('/api/professor/classes/<int:class_id>/attendance')
+def class_attendance_summary(class_id):
+    """Per-session turnout and per-student totals for a class."""
+    if 'user_id' not in session or session.get('user_type') != 'professor':
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    cls = Class.query.filter_by(id=class_id, professor_id=session['user_id']).first()
+    if not cls:
+        return jsonify({'error': 'Class not found'}), 404
+
+    # Include this worker's buffered check-ins; other workers flush within a second
+    attendance_buffer.flush()
+
+    enrolled = db.session.query(func.count()).select_from(enrollments).filter(
+        enrollments.c.class_id == class_id).scalar()
+    sessions = AttendanceSession.query.filter_by(class_id=class_id).order_by(
+        AttendanceSession.opened_at.desc()).all()
+
+    attended = db.session.query(
+        AttendanceRecord.student_id, func.count().label('attended')
+    ).filter(AttendanceRecord.class_id == class_id).group_by(AttendanceRecord.student_id).subquery()
+    roster = db.session.query(
+        Student.id, Student.first_name, Student.last_name, func.coalesce(attended.c.attended, 0)
+    ).join(enrollments, enrollments.c.student_id == Student.id).outerjoin(
+        attended, attended.c.student_id == Student.id
+    ).filter(enrollments.c.class_id == class_id).order_by(Student.last_name, Student.first_name).all()
+
+    total_sessions = len(sessions)
+    return jsonify({
+        'class_id': class_id,
+        'enrolled': enrolled,
+        'sessions': [dict(s.to_dict(), rate=round(s.present_count / enrolled, 3) if enrolled else None)
+                     for s in sessions],
+        'students': [{
+            'id': student_id,
+            'name': f"{first_name} {last_name}",
+            'attended': count,
+            'rate': round(count / total_sessions, 3) if total_sessions else None
+        } for student_id, first_name, last_name, count in roster]
+    })
+
+# --- ADDED: Calendar API ---
+def calendar_scope(user_type, user_id):
+    """SQL filter for every event a user can see: their classes' events plus personal ones."""
+    if user_type == 'professor':
+        class_ids = db.session.query(Class.id).filter(Class.professor_id == user_id)
+    else:
+        class_ids = db.session.query(enrollments.c.class_id).filter(enrollments.c.student_id == user_id)
+    return or_(
+        CalendarEvent.class_id.in_(class_ids.scalar_subquery()),
+        and_(CalendarEvent.owner_type == user_type, CalendarEvent.owner_id == user_id)
+    )
+
+def parse_iso_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+@app.route('/api/calendar/events', methods=['GET', 'POST'])
+def calendar_events():
+    """Range query (?from=YYYY-MM-DD&to=YYYY-MM-DD) and creation of calendar events."""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    user_id = session['user_id']
+    user_type = session.get('user_type')
+
+    if request.method == 'GET':
+        today = datetime.utcnow().date()
+        start = parse_iso_date(request.args.get('from')) if request.args.get('from') else today.replace(day=1)
+        end = parse_iso_date(request.args.get('to')) if request.args.get('to') else start + timedelta(days=41)
+        if not start or not end:
+            return jsonify({'error': 'Dates must use the YYYY-MM-DD format'}), 400
+        if end < start:
+            return jsonify({'error': '"to" must not be before "from"'}), 400
+        if (end - start).days > 366:
+            return jsonify({'error': 'Date range may not exceed one year'}), 400
+
+        events = CalendarEvent.query.options(joinedload(CalendarEvent.parent_class)).filter(
+            calendar_scope(user_type, user_id),
+            CalendarEvent.event_date >= start,
+            CalendarEvent.event_date <= end
+        ).order_by(CalendarEvent.event_date, CalendarEvent.id).all()
+        return jsonify([event.to_dict() for event in events])
+
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data, dict):
+        return jsonify({'error': 'No JSON data provided'}), 400
+
+    title = data.get('title')
+    title = title.strip() if isinstance(title, str) else ''
+    event_date = parse_iso_date(data.get('date'))
+    if not title:
+        return jsonify({'error': 'Event title is required'}), 400
+    if not event_date:
+        return jsonify({'error': 'Dates must use the YYYY-MM-DD format'}), 400
+
+    event = CalendarEvent(title=title[:200], event_date=event_date, source='manual')
+    class_id = data.get('class_id')
+    if class_id:
+        # Class-wide events can only be posted by the owning professor
+        if isinstance(class_id, bool) or not isinstance(class_id, (int, str)):
+            return jsonify({'error': 'Invalid class ID format'}), 400
+        try:
+            cls = Class.query.get(int(class_id))
+        except ValueError:
+            return jsonify({'error': 'Invalid class ID format'}), 400
+        if user_type != 'professor' or not cls or cls.professor_id != user_id:
+            return jsonify({'error': 'You cannot add events to this class'}), 403
+        event.class_id = cls.id
+    else:
+        event.owner_type = user_type
+        event.owner_id = user_id
+
+    try:
+        db.session.add(event)
+        db.session.commit()
+        if event.class_id:
+            notify_class_students(event.class_id, 'event',
+                                  f"New event in {event.parent_class.name}: {event.title} on {event.event_date.strftime('%b %d, %Y')}")
+        return jsonify(event.to_dict()), 201
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error creating calendar event: {e}")
+        return jsonify({'error': 'Failed to create event'}), 500
+
+@app.route('/api/calendar/events/<int:event_id>', methods=['PUT', 'DELETE'])
+def modify_calendar_event(event_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    user_id = session['user_id']
+    user_type = session.get('user_type')
+
+    event = CalendarEvent.query.get(event_id)
+    if not event:
+        return jsonify({'error': 'Event not found'}), 404
+    if event.source == 'assignment':
+        return jsonify({'error': 'Deadline events follow their assignment and cannot be edited'}), 400
+
+    is_owner = event.owner_type == user_type and event.owner_id == user_id
+    is_class_professor = (event.class_id is not None and user_type == 'professor'
+                          and event.parent_class.professor_id == user_id)
+    if not (is_owner or is_class_professor):
+        return jsonify({'error': 'You cannot modify this event'}), 403
+
+    if request.method == 'PUT':
+        data = request.get_json(silent=True)
+        if not data or not isinstance(data, dict):
+            return jsonify({'error': 'No JSON data provided'}), 400
+        if 'title' in data:
+            title = data.get('title')
+            title = title.strip() if isinstance(title, str) else ''
+            if not title:
+                return jsonify({'error': 'Event title is required'}), 400
+            event.title = title[:200]
+        if 'date' in data:
+            event_date = parse_iso_date(data.get('date'))
+            if not event_date:
+                return jsonify({'error': 'Dates must use the YYYY-MM-DD format'}), 400
+            event.event_date = event_date
+        event.version += 1
+        try:
+            db.session.commit()
+            return jsonify(event.to_dict()), 200
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error updating calendar event: {e}")
+            return jsonify({'error': 'Failed to update event'}), 500
+
+    try:
+        db.session.delete(event)
+        db.session.commit()
+        return jsonify({'message': 'Event deleted successfully'}), 200
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error deleting calendar event: {e}")
+        return jsonify({'error': 'Failed to delete event'}), 500
+
+# --- ADDED: Cached per-user iCal feed ---
+# The rendered feed is kept per user together with a fingerprint of the
+# underlying events (row count, latest update, summed versions) and of their
+# classes (latest class change in the change feed, so a rename shows up in
+# event summaries).  The fingerprint is one aggregate query over the indexed
+# scope; the feed body is only rebuilt when it changes.
+ical_cache = {}
+ical_cache_lock = Lock()
+ICAL_CACHE_MAX_ENTRIES = 1000
+
+def ical_escape(text):
+    return (text.replace('\\', '\\\\').replace(';', '\\;')
+            .replace(',', '\\,').replace('\n', '\\n'))
+
+def ical_fold(line, limit=75):
+    """Folds a content line at 75 octets (RFC 5545 3.1) without splitting UTF-8 characters."""
+    chunks = []
+    current, size = '', 0
+    for char in line:
+        width = len(char.encode('utf-8'))
+        if size + width > limit:
+            chunks.append(current)
+            current, size = ' ', 1
+        current += char
+        size += width
+    chunks.append(current)
+    return '\r\n'.join(chunks)
+
+def build_ical_feed(user_type, user_id):
+    events = CalendarEvent.query.options(joinedload(CalendarEvent.parent_class)).filter(
+        calendar_scope(user_type, user_id)
+    ).order_by(CalendarEvent.event_date, CalendarEvent.id).all()
+
+    stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//UCC COE LMS//Calendar//EN',
+        'CALSCALE:GREGORIAN'
+    ]
+    for event in events:
+        summary = event.title
+        if event.parent_class:
+            summary = f"{summary} ({event.parent_class.name})"
+        lines.extend([
+            'BEGIN:VEVENT',
+            f'UID:event-{event.id}@lms',
+            f'DTSTAMP:{stamp}',
+            f'DTSTART;VALUE=DATE:{event.event_date.strftime("%Y%m%d")}',
+            f'DTEND;VALUE=DATE:{(event.event_date + timedelta(days=1)).strftime("%Y%m%d")}',
+            f'SUMMARY:{ical_escape(summary)}',
+            f'SEQUENCE:{event.version - 1}',
+            'END:VEVENT'
+        ])
+    lines.append('END:VCALENDAR')
+    return '\r\n'.join(ical_fold(line) for line in lines) + '\r\n'
+
+def get_ical_feed(user_type, user_id):
+    scope = calendar_scope(user_type, user_id)
+    class_seq = select(func.max(ChangeLog.seq)).where(
+        ChangeLog.entity == 'class',
+        ChangeLog.class_id.in_(select(CalendarEvent.class_id).where(scope))
+    ).scalar_subquery()
+    fingerprint = tuple(db.session.query(
+        func.count(CalendarEvent.id),
+        func.max(CalendarEvent.updated_at),
+        func.coalesce(func.sum(CalendarEvent.version), 0),
+        class_seq
+    ).filter(scope).one())
+
+    key = (user_type, user_id)
+    with ical_cache_lock:
+        cached = ical_cache.get(key)
+    if cached and cached[0] == fingerprint:
+        return cached[1]
+
+    body = build_ical_feed(user_type, user_id)
+    with ical_cache_lock:
+        if len(ical_cache) >= ICAL_CACHE_MAX_ENTRIES and key not in ical_cache:
+            ical_cache.pop(next(iter(ical_cache)))
+        ical_cache[key] = (fingerprint, body)
+    return body
+
+calendar_feed_signer = URLSafeSerializer(app.secret_key, salt='calendar-feed')
+
+@app.route('/api/calendar/feed-url')
+def calendar_feed_url():
+    """Returns a private subscription URL that calendar apps can poll without a session."""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    token = calendar_feed_signer.dumps([session.get('user_type'), session['user_id']])
+    return jsonify({'url': url_for('calendar_feed', token=token, _external=True)})
+
+@app.route('/calendar/<token>.ics')
+def calendar_feed(token):
+    try:
+        user_type, user_id = calendar_feed_signer.loads(token)
+    except BadSignature:
+        return 'Invalid calendar link', 404
+
+    body = get_ical_feed(user_type, user_id)
+    etag = hashlib.sha1(body.encode('utf-8')).hexdigest()
+    # Weak comparison: compression marks the ETag weak on the way out
+    if request.if_none_match.contains_weak(etag):
+        return '', 304
+    response = app.response_class(body, mimetype='text/calendar')
+    response.set_etag(etag)
+    return response
+
+# --- ADDED: Response compression ---
+# HTML, JSON and other text responses above COMPRESS_MIN_SIZE are encoded with
+# zstd (when the zstandard package is installed and the client accepts it) or
+# gzip.  Streamed responses are compressed incrementally and sync-flushed every
+# COMPRESS_STREAM_FLUSH_SIZE bytes so the client keeps receiving data; event streams and file passthroughs
+# (images, archives, static files) are left alone.
+COMPRESS_MIMETYPES = {
+    'text/html', 'text/plain', 'text/css', 'text/calendar', 'text/csv',
+    'application/json', 'application/javascript', 'application/x-ndjson'
+}
+COMPRESS_MIN_SIZE = 500
+COMPRESS_GZIP_LEVEL = 6
+COMPRESS_ZSTD_LEVEL = 3
+COMPRESS_STREAM_FLUSH_SIZE = 16 * 1024
+
+compression_metrics = {'responses': 0, 'bytes_in': 0, 'bytes_out': 0, 'cpu_seconds': 0.0}
+compression_metrics_lock = Lock()
+
+def record_compression(bytes_in, bytes_out, cpu_seconds):
+    with compression_metrics_lock:
+        compression_metrics['responses'] += 1
+        compression_metrics['bytes_in'] += bytes_in
+        compression_metrics['bytes_out'] += bytes_out
+        compression_metrics['cpu_seconds'] += cpu_seconds
+
+class StreamCompressor:
+    """Incremental gzip/zstd encoder with the same interface for both."""
+
+    def __init__(self, encoding):
+        if encoding == 'zstd':
+            self.obj = zstandard.ZstdCompressor(level=COMPRESS_ZSTD_LEVEL).compressobj()
+            self.sync_flag = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        else:
+            self.obj = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)  # 31 = gzip container
+            self.sync_flag = zlib.Z_SYNC_FLUSH
+
+    def compress(self, data):
+        return self.obj.compress(data)
+
+    def sync(self):
+        return self.obj.flush(self.sync_flag)
+
+    def finish(self):
+        return self.obj.flush()
+
+def choose_encoding():
+    accepted = request.accept_encodings
+    if zstandard is not None and accepted['zstd']:
+        return 'zstd'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+def compress_stream(chunks, encoding):
+    compressor = StreamCompressor(encoding)
+    bytes_in = bytes_out = pending = 0
+    cpu_seconds = 0.0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if not chunk:
+                continue
+            started = time.thread_time()
+            out = compressor.compress(chunk)
+            pending += len(chunk)
+            # Flush in blocks: syncing after every small chunk would defeat compression
+            if pending >= COMPRESS_STREAM_FLUSH_SIZE:
+                out += compressor.sync()
+                pending = 0
+            cpu_seconds += time.thread_time() - started
+            bytes_in += len(chunk)
+            bytes_out += len(out)
+            if out:
+                yield out
+        out = compressor.finish()
+        bytes_out += len(out)
+        yield out
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+        record_compression(bytes_in, bytes_out, cpu_seconds)
+
+@app.after_request
+def compress_response(response):
+    if response.mimetype not in COMPRESS_MIMETYPES:
+        return response
+    response.vary.add('Accept-Encoding')
+
+    if (response.direct_passthrough or not 200 <= response.status_code < 300
+            or response.status_code in (204, 206) or request.method == 'HEAD'
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    encoding = choose_encoding()
+    if not encoding:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        started = time.thread_time()
+        compressor = StreamCompressor(encoding)
+        compressed = compressor.compress(data) + compressor.finish()
+        record_compression(len(data), len(compressed), time.thread_time() - started)
+        response.set_data(compressed)
+
+    response.headers['Content-Encoding'] = encoding
+    # The encoded bytes differ from the identity representation
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+@app.route('/admin/metrics')
+def admin_metrics():
+    """Reports compression ratio and CPU time"""
+    if not is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    with compression_metrics_lock:
+        metrics = dict(compression_metrics)
+    metrics['ratio'] = round(metrics['bytes_out'] / metrics['bytes_in'], 4) if metrics['bytes_in'] else None
+    metrics['zstd_available'] = zstandard is not None
+    return jsonify({'compression': metrics})
+
 # Serve static files for templates
 @app.route('/static/<path:filename>')
 def serve_static(filename):
@@ -1030,6 +4176,10 @@ if __name__ == '__main__':
     else:
         print("⚠ Database file will be created")
     
+    # Resume any mail and jobs left queued by a previous run
+    wake_mail_worker()
+    wake_job_runner()
+    
     # Only open browser if not in debug mode or first run
     import sys
     if not os.environ.get("WERKZEUG_RUN_MAIN"):
@@ -0,0 +1,12 @@
+"""Indexes for lookups that previously scanned whole tables.
+
+enrollments is keyed (student_id, class_id), so rosters and notification
+fan-out by class had no usable index; classes are listed by professor and
+reset tokens are looked up by email.
+"""
+
+
+def upgrade(ctx):
+    ctx.create_index('ix_enrollments_class_id', 'enrollments', ['class_id', 'student_id'])
+    ctx.create_index('ix_class_professor_id', 'class', ['professor_id'])
+    ctx.create_index('ix_password_reset_token_email', 'password_reset_token', ['email'])
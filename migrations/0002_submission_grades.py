@@ -0,0 +1,7 @@
+"""Grade columns on submission for databases created before grading existed."""
+
+
+def upgrade(ctx):
+    ctx.add_column('submission', 'grade', 'FLOAT')
+    ctx.add_column('submission', 'feedback', 'TEXT')
+    ctx.add_column('submission', 'graded_at', 'DATETIME')
@@ -0,0 +1,14 @@
+"""Identity rows for accounts created before the identity table existed.
+
+The table itself is created by db.create_all(); accounts are copied from
+student and professor in rowid batches.  INSERT OR IGNORE keeps the step
+idempotent and skips an email already claimed by the other role.
+"""
+
+
+def upgrade(ctx):
+    for table in ('student', 'professor'):
+        ctx.backfill(f'{table}_identities', table,
+                     'INSERT OR IGNORE INTO identity (email, user_type, user_id, password) '
+                     f"SELECT username, '{table}', id, password FROM {table} "
+                     'WHERE rowid BETWEEN :first AND :last')
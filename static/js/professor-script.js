@@ -3,10 +3,36 @@
 // Global variables
 let currentClassId = null;
 let classes = [];
+// Change-feed position of classes (null until synced with the server)
+let syncSeq = null;
+// Account the cached list belongs to, as reported by the server
+let syncOwner = null;
 let assignments = [];
 let submissions = [];
 let calendarEvents = {};
 
+// Initial data embedded by the server (see bootstrap_payload in app.py)
+const bootstrapData = readBootstrapData();
+
+function readBootstrapData() {
+  const el = document.getElementById('bootstrap-data');
+  if (!el) return null;
+  try {
+    return JSON.parse(el.textContent);
+  } catch (error) {
+    console.error('Invalid bootstrap data:', error);
+    return null;
+  }
+}
+
+// Return an embedded value once; later calls fall back to the API
+function takeBootstrap(key) {
+  if (!bootstrapData || bootstrapData[key] === undefined) return null;
+  const value = bootstrapData[key];
+  delete bootstrapData[key];
+  return value;
+}
+
 // DOM Elements
 const sidebar = document.getElementById('sidebar');
 const contentSections = document.querySelectorAll('.content-section');
@@ -55,15 +81,15 @@ document.addEventListener('click', function() {
 });
 
 document.addEventListener('DOMContentLoaded', function() {
-  // Initialize dashboard stats
-  updateDashboardStats();
-  
-  // Load classes from API
+  // Load classes (then dashboard stats) from the embedded data or the API
   loadClasses();
   
   // Initialize calendar
   initializeCalendar();
   
+  // Connect the notification bell to the live stream
+  initializeNotifications();
+  
   // Event listeners for class management
   document.getElementById('create-class-btn').addEventListener('click', showCreateClassModal);
   document.getElementById('cancel-class').addEventListener('click', hideCreateClassModal);
@@ -153,14 +179,49 @@ document.addEventListener('DOMContentLoaded', function() {
   document.getElementById('save-grade').addEventListener('click', saveGrade);
 });
 
-// Load classes from API
+// Load classes: embedded data, else the cached list brought up to date through
+// the change feed (embedded when the class_sync cookie told the server which
+// list we hold), else the full list from the API
 async function loadClasses() {
+  syncOwner = takeBootstrap('sync_owner');
+  const embeddedClasses = takeBootstrap('classes');
+  if (embeddedClasses) {
+    classes = embeddedClasses;
+    syncSeq = takeBootstrap('sync_seq');
+    saveClasses();
+    renderClassList();
+    updateDashboardStats();
+    return;
+  }
+
+  const embeddedSync = takeBootstrap('sync');
+  loadClassesFromStorage();
+  if (embeddedSync && syncSeq === embeddedSync.since) {
+    applySyncResult(embeddedSync);
+    renderClassList();
+    updateDashboardStats();
+    return;
+  }
+  if (!embeddedSync && syncSeq !== null) {
+    await syncClasses(true);
+  } else {
+    // Nothing cached, or the cookie outlived the cached list
+    await reloadClasses();
+  }
+  updateDashboardStats();
+}
+
+// Fetch the full class list and remember the change-feed position it reflects
+async function reloadClasses() {
   try {
     const response = await fetch('/api/professor/classes');
     if (response.ok) {
       classes = await response.json();
+      const seq = response.headers.get('X-Sync-Seq');
+      syncSeq = seq === null ? null : Number(seq);
+      syncOwner = response.headers.get('X-Sync-Owner');
+      saveClasses();
       renderClassList();
-      updateDashboardStats();
     } else {
       console.error('Failed to load classes:', response.status);
     }
@@ -169,6 +230,94 @@ async function loadClasses() {
   }
 }
 
+// Apply only the changes since syncSeq (class edits, enrollments, assignments)
+async function syncClasses(render = false) {
+  if (syncSeq === null) {
+    await reloadClasses();
+    return;
+  }
+
+  try {
+    const response = await fetch(`/api/sync?since=${syncSeq}`);
+    if (!response.ok) {
+      console.error('Failed to sync classes:', response.status);
+      return;
+    }
+    const result = await response.json();
+    if (result.reset || result.owner !== syncOwner) {
+      await reloadClasses();
+      return;
+    }
+
+    applySyncResult(result);
+    if (render || result.changes.length > 0) {
+      renderClassList();
+    }
+  } catch (error) {
+    console.error('Error syncing classes:', error);
+  }
+}
+
+function applySyncResult(result) {
+  result.changes.forEach(applyClassChange);
+  syncSeq = result.seq;
+  saveClasses();
+}
+
+function applyClassChange(change) {
+  if (change.type === 'class') {
+    const index = classes.findIndex(c => c.id === change.id);
+    if (change.action === 'delete') {
+      if (index !== -1) classes.splice(index, 1);
+    } else if (index !== -1) {
+      // Keep the roster, assignments and materials already held
+      classes[index] = { ...classes[index], ...change.data };
+    } else {
+      classes.push({ ...change.data, students: [], materials: [], assignments: [] });
+    }
+  } else {
+    // Rosters are keyed by school ID, assignments by assignment ID
+    const classItem = classes.find(c => c.id === change.class_id);
+    if (!classItem) return;
+    const key = change.type === 'enrollment' ? 'students' : 'assignments';
+    classItem[key] = (classItem[key] || []).filter(item => item.id !== change.id);
+    if (change.action === 'upsert') {
+      classItem[key].push(change.data);
+    }
+  }
+}
+
+// Save classes to localStorage together with their change-feed position
+function saveClasses() {
+  localStorage.setItem('professorClasses', JSON.stringify({ owner: syncOwner, seq: syncSeq, classes: classes }));
+  updateSyncCookie();
+}
+
+// Tell the dashboard page which list we hold so it embeds only the changes since
+function updateSyncCookie() {
+  if (syncOwner && syncSeq !== null) {
+    document.cookie = `class_sync=${syncOwner}:${syncSeq}; path=/dashboard; max-age=2592000; SameSite=Lax`;
+  } else {
+    document.cookie = 'class_sync=; path=/dashboard; max-age=0';
+  }
+}
+
+// Load classes from localStorage; a list cached for another account is ignored
+function loadClassesFromStorage() {
+  const saved = localStorage.getItem('professorClasses');
+  if (!saved) return;
+  try {
+    const parsed = JSON.parse(saved);
+    if (!syncOwner || parsed.owner === syncOwner) {
+      classes = parsed.classes || [];
+      syncSeq = typeof parsed.seq === 'number' ? parsed.seq : null;
+      syncOwner = parsed.owner || null;
+    }
+  } catch (error) {
+    console.error('Invalid saved classes:', error);
+  }
+}
+
 // Generate random class code
 function generateClassCode() {
   const chars = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789';
@@ -234,6 +383,7 @@ async function createClass() {
     if (response.ok) {
       // Add the new class to the local array
       classes.push(result);
+      saveClasses();
       renderClassList();
       hideCreateClassModal();
       alert(`Class "${className}" created successfully! Class Code: ${classCode}`);
@@ -309,21 +459,48 @@ async function deleteClass(classId) {
 
     const result = await response.json();
 
-    if (response.ok) {
-      // Remove the class from the local array
-      classes = classes.filter(c => c.id !== classId);
-      renderClassList();
+    if (!response.ok) {
+      alert(result.error || 'Failed to delete class');
+      return;
+    }
+
+    // Deletion runs as a background job; hide the class while it works, and
+    // only report success and refresh the counts once the job has finished
+    classes = classes.filter(c => c.id !== classId);
+    saveClasses();
+    renderClassList();
+
+    const job = result.job_id ? await waitForJob(result.job_id) : null;
+    if (job && job.status === 'succeeded') {
+      await syncClasses();
       alert('Class deleted successfully!');
-      updateDashboardStats(); // Update dashboard after class deletion
+    } else if (job && job.status !== 'failed' && job.status !== 'cancelled') {
+      alert('Class deletion is still in progress. It will disappear from your counts when it finishes.');
     } else {
-      alert(result.error || 'Failed to delete class');
+      alert((job && job.error) || 'Failed to delete class');
+      await reloadClasses(); // Put the class back
     }
+    updateDashboardStats(); // Update dashboard after class deletion
   } catch (error) {
     console.error('Error deleting class:', error);
     alert('Error deleting class. Please try again.');
   }
 }
 
+// Poll a background job until it finishes or the wait times out
+async function waitForJob(jobId, timeoutMs = 60000, intervalMs = 1000) {
+  const deadline = Date.now() + timeoutMs;
+  let job = null;
+  while (Date.now() < deadline) {
+    const response = await fetch(`/api/jobs/${jobId}`);
+    if (!response.ok) return job;
+    job = await response.json();
+    if (['succeeded', 'failed', 'cancelled'].includes(job.status)) return job;
+    await new Promise(resolve => setTimeout(resolve, intervalMs));
+  }
+  return job;
+}
+
 // Copy class code to clipboard
 function copyClassCode(code) {
   navigator.clipboard.writeText(code).then(() => {
@@ -673,8 +850,13 @@ async function saveAssignmentToClass(assignment) {
     });
 
     if (response.ok) {
+      // Use the server-assigned ID so later grading requests match
+      const saved = await response.json();
+      assignment.id = saved.id;
+      
       // Add the new assignment to the local array
       classItem.assignments.push(assignment);
+      saveClasses();
       
       // Update UI
       loadClassAssignments(); // Bug Fix: Refresh the assignments list
@@ -765,6 +947,9 @@ function loadClassAssignments() {
         <button class="btn-primary" onclick="viewSubmissions('${assignment.id}')">
           <i class="fas fa-eye"></i> View Submissions
         </button>
+        <a class="btn-secondary" href="/api/professor/classes/${currentClassId}/assignments/${assignment.id}/submissions.zip">
+          <i class="fas fa-file-archive"></i> Download All
+        </a>
       </div>
     `;
     assignmentsContainer.appendChild(assignmentElement);
@@ -1093,6 +1278,53 @@ function base64ToBlob(base64) {
   return new Blob([uInt8Array], { type: contentType });
 }
 
+// Live notifications (Server-Sent Events)
+let notifications = [];
+let unreadNotifications = 0;
+
+function initializeNotifications() {
+  const bell = document.querySelector('.notification-icon');
+  const badge = document.querySelector('.notification-badge');
+  if (!bell || !badge || !window.EventSource) return;
+  
+  function updateBadge() {
+    badge.textContent = unreadNotifications;
+    badge.style.display = unreadNotifications > 0 ? '' : 'none';
+  }
+  
+  // EventSource reconnects on its own and sends Last-Event-ID, so missed
+  // notifications are replayed by the server
+  const source = new EventSource('/api/notifications/stream');
+  source.addEventListener('notification', (e) => {
+    const notification = JSON.parse(e.data);
+    notifications.unshift(notification);
+    notifications = notifications.slice(0, 20);
+    unreadNotifications++;
+    updateBadge();
+  });
+  
+  bell.addEventListener('click', async (e) => {
+    e.stopPropagation();
+    if (notifications.length === 0) {
+      try {
+        const response = await fetch('/api/notifications');
+        if (response.ok) {
+          notifications = await response.json();
+        }
+      } catch (error) {
+        console.error('Error loading notifications:', error);
+      }
+    }
+    unreadNotifications = 0;
+    updateBadge();
+    alert(notifications.length > 0
+      ? notifications.map(n => `• ${n.message}`).join('\n')
+      : 'No notifications yet');
+  });
+  
+  updateBadge();
+}
+
 // Calendar functionality
 function initializeCalendar() {
   const monthYear = document.getElementById('month-year');
@@ -1140,17 +1372,62 @@ function initializeCalendar() {
     }
   }
   
-  prevMonth.addEventListener('click', () => {
-    currentDate.setMonth(currentDate.getMonth() - 1);
+  // Fetch only the visible month from the server, then draw it
+  async function loadAndRenderCalendar() {
     renderCalendar();
+    await loadCalendarEvents(currentDate.getFullYear(), currentDate.getMonth());
+    renderCalendar();
+  }
+  
+  // Bug Fix: Replace buttons so re-initializing doesn't stack click handlers
+  prevMonth.replaceWith(prevMonth.cloneNode(true));
+  nextMonth.replaceWith(nextMonth.cloneNode(true));
+  
+  document.getElementById('prev-month').addEventListener('click', () => {
+    currentDate.setMonth(currentDate.getMonth() - 1);
+    loadAndRenderCalendar();
   });
   
-  nextMonth.addEventListener('click', () => {
+  document.getElementById('next-month').addEventListener('click', () => {
     currentDate.setMonth(currentDate.getMonth() + 1);
-    renderCalendar();
+    loadAndRenderCalendar();
   });
   
-  renderCalendar();
+  loadAndRenderCalendar();
+}
+
+// Format a Date as YYYY-MM-DD for the calendar API
+function toIsoDate(date) {
+  const month = String(date.getMonth() + 1).padStart(2, '0');
+  const day = String(date.getDate()).padStart(2, '0');
+  return `${date.getFullYear()}-${month}-${day}`;
+}
+
+// Load events for one month from the server into calendarEvents
+async function loadCalendarEvents(year, month) {
+  const from = toIsoDate(new Date(year, month, 1));
+  const to = toIsoDate(new Date(year, month + 1, 0));
+  
+  try {
+    const response = await fetch(`/api/calendar/events?from=${from}&to=${to}`);
+    if (!response.ok) {
+      console.error('Failed to load calendar events:', response.status);
+      return;
+    }
+    const events = await response.json();
+    
+    calendarEvents = {};
+    events.forEach(event => {
+      const [y, m, d] = event.date.split('-').map(Number);
+      const dateKey = `${y}-${m}-${d}`;
+      if (!calendarEvents[dateKey]) {
+        calendarEvents[dateKey] = [];
+      }
+      calendarEvents[dateKey].push(event.class_name ? `${event.title} (${event.class_name})` : event.title);
+    });
+  } catch (error) {
+    console.error('Error loading calendar events:', error);
+  }
 }
 
 // Function to update the selected date in the modal before showing it
@@ -1193,7 +1470,7 @@ document.getElementById('close-event').addEventListener('click', () => {
   document.getElementById('event-modal').style.display = 'none';
 });
 
-document.getElementById('save-event').addEventListener('click', () => {
+document.getElementById('save-event').addEventListener('click', async () => {
   const eventText = document.getElementById('event-text').value.trim();
   if (!eventText) return;
   
@@ -1202,14 +1479,25 @@ document.getElementById('save-event').addEventListener('click', () => {
     return;
   }
   
-  // Use the globally stored date object
-  const dateKey = `${currentSelectedDate.getFullYear()}-${currentSelectedDate.getMonth() + 1}-${currentSelectedDate.getDate()}`;
-  
-  if (!calendarEvents[dateKey]) {
-    calendarEvents[dateKey] = [];
+  try {
+    // Persist the event so it survives a reload
+    const response = await fetch('/api/calendar/events', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ title: eventText, date: toIsoDate(currentSelectedDate) })
+    });
+    
+    if (!response.ok) {
+      const result = await response.json();
+      alert(result.error || 'Failed to save event');
+      return;
+    }
+  } catch (error) {
+    console.error('Error saving event:', error);
+    alert('Error saving event. Please try again.');
+    return;
   }
   
-  calendarEvents[dateKey].push(eventText);
   document.getElementById('event-text').value = '';
   document.getElementById('event-modal').style.display = 'none';
   
@@ -1221,10 +1509,12 @@ document.getElementById('save-event').addEventListener('click', () => {
 // Update dashboard statistics
 async function updateDashboardStats() {
   try {
-    const response = await fetch('/api/professor/stats');
-    if (response.ok) {
-      const stats = await response.json();
-      
+    let stats = takeBootstrap('stats');
+    if (!stats) {
+      const response = await fetch('/api/professor/stats');
+      stats = response.ok ? await response.json() : null;
+    }
+    if (stats) {
       document.getElementById('total-classes').textContent = stats.total_classes;
       document.getElementById('total-students').textContent = stats.total_students;
       document.getElementById('pending-tasks').textContent = stats.pending_tasks;
@@ -6,6 +6,32 @@ let enrolledClasses = [];
 let assignments = [];
 let submissions = [];
 let calendarEvents = {};
+// Change-feed position of enrolledClasses (null until synced with the server)
+let syncSeq = null;
+// Account the cached list belongs to, as reported by the server
+let syncOwner = null;
+
+// Initial data embedded by the server (see bootstrap_payload in app.py)
+const bootstrapData = readBootstrapData();
+
+function readBootstrapData() {
+  const el = document.getElementById('bootstrap-data');
+  if (!el) return null;
+  try {
+    return JSON.parse(el.textContent);
+  } catch (error) {
+    console.error('Invalid bootstrap data:', error);
+    return null;
+  }
+}
+
+// Return an embedded value once; later calls fall back to the API
+function takeBootstrap(key) {
+  if (!bootstrapData || bootstrapData[key] === undefined) return null;
+  const value = bootstrapData[key];
+  delete bootstrapData[key];
+  return value;
+}
 
 // DOM Elements
 const sidebar = document.getElementById('sidebar');
@@ -52,15 +78,15 @@ document.addEventListener('click', function() {
 });
 
 document.addEventListener('DOMContentLoaded', function() {
-  // Initialize dashboard stats
-  updateDashboardStats();
-  
-  // Load enrolled classes from API
+  // Load enrolled classes (then dashboard stats) from the embedded data or the API
   loadEnrolledClasses();
   
   // Initialize calendar
   initializeCalendar();
   
+  // Connect the notification bell to the live stream
+  initializeNotifications();
+  
   // Event listeners for class management
   document.getElementById('join-class-btn').addEventListener('click', showJoinClassModal);
   document.getElementById('cancel-join-class').addEventListener('click', hideJoinClassModal);
@@ -115,15 +141,56 @@ document.addEventListener('DOMContentLoaded', function() {
   });
 });
 
-// Load enrolled classes from API
+function renderEnrolledClasses() {
+  renderClassList();
+  updateDashboardStats();
+  updateGradeFilter();
+}
+
+// Load enrolled classes: embedded data, else the cached list brought up to date
+// through the change feed (embedded when the class_sync cookie told the server
+// which list we hold), else the full list from the API
 async function loadEnrolledClasses() {
+  syncOwner = takeBootstrap('sync_owner');
+  const embeddedClasses = takeBootstrap('classes');
+  if (embeddedClasses) {
+    enrolledClasses = embeddedClasses;
+    syncSeq = takeBootstrap('sync_seq');
+    saveEnrolledClasses();
+    renderEnrolledClasses();
+    return;
+  }
+
+  const embeddedSync = takeBootstrap('sync');
+  loadEnrolledClassesFromStorage();
+  if (embeddedSync) {
+    if (syncSeq === embeddedSync.since) {
+      applySyncResult(embeddedSync);
+      renderEnrolledClasses();
+    } else {
+      // The cookie outlived the cached list
+      await reloadEnrolledClasses();
+    }
+    return;
+  }
+  if (syncSeq !== null) {
+    await syncEnrolledClasses(true);
+    return;
+  }
+  await reloadEnrolledClasses();
+}
+
+// Fetch the full class list and remember the change-feed position it reflects
+async function reloadEnrolledClasses() {
   try {
     const response = await fetch('/api/professor/classes');
     if (response.ok) {
       enrolledClasses = await response.json();
-      renderClassList();
-      updateDashboardStats();
-      updateGradeFilter();
+      const seq = response.headers.get('X-Sync-Seq');
+      syncSeq = seq === null ? null : Number(seq);
+      syncOwner = response.headers.get('X-Sync-Owner');
+      saveEnrolledClasses();
+      renderEnrolledClasses();
     } else {
       console.error('Failed to load classes:', response.status);
     }
@@ -132,6 +199,61 @@ async function loadEnrolledClasses() {
   }
 }
 
+// Apply only the changes since syncSeq (joins, unenrolls, class edits, new assignments)
+async function syncEnrolledClasses(render = false) {
+  if (syncSeq === null) {
+    await reloadEnrolledClasses();
+    return;
+  }
+
+  try {
+    const response = await fetch(`/api/sync?since=${syncSeq}`);
+    if (!response.ok) {
+      console.error('Failed to sync classes:', response.status);
+      return;
+    }
+    const result = await response.json();
+    if (result.reset || result.owner !== syncOwner) {
+      await reloadEnrolledClasses();
+      return;
+    }
+
+    applySyncResult(result);
+    if (render || result.changes.length > 0) {
+      renderEnrolledClasses();
+    }
+  } catch (error) {
+    console.error('Error syncing classes:', error);
+  }
+}
+
+function applySyncResult(result) {
+  result.changes.forEach(applyClassChange);
+  syncSeq = result.seq;
+  saveEnrolledClasses();
+}
+
+function applyClassChange(change) {
+  if (change.type === 'class') {
+    const index = enrolledClasses.findIndex(c => c.id === change.id);
+    if (change.action === 'delete') {
+      if (index !== -1) enrolledClasses.splice(index, 1);
+    } else if (index !== -1) {
+      // Keep locally held assignments and materials
+      enrolledClasses[index] = { ...enrolledClasses[index], ...change.data };
+    } else {
+      enrolledClasses.push(change.data);
+    }
+  } else if (change.type === 'assignment') {
+    const classItem = enrolledClasses.find(c => c.id === change.class_id);
+    if (!classItem) return;
+    classItem.assignments = (classItem.assignments || []).filter(a => a.id !== change.id);
+    if (change.action === 'upsert') {
+      classItem.assignments.push(change.data);
+    }
+  }
+}
+
 // Show join class modal
 function showJoinClassModal() {
   document.getElementById('join-class-modal').style.display = 'flex';
@@ -166,8 +288,8 @@ async function joinClass() {
     if (response.ok) {
       alert(`Successfully joined ${result.class.name}!`);
       hideJoinClassModal();
-      // Reload classes to show the newly joined class
-      loadEnrolledClasses();
+      // Pull the newly joined class from the change feed
+      syncEnrolledClasses();
     } else {
       alert(result.error || 'Failed to join class');
     }
@@ -243,8 +365,8 @@ async function unenrollClass(classId) {
 
     if (response.ok) {
       alert('Successfully unenrolled from class!');
-      // Reload classes
-      loadEnrolledClasses();
+      // Drop the class via the change feed
+      syncEnrolledClasses();
     } else {
       alert(result.error || 'Failed to unenroll from class');
     }
@@ -471,39 +593,42 @@ function submitAssignment() {
   const assignment = classItem.assignments.find(a => a.id === assignmentId);
   if (!assignment) return;
   
-  // For demo purposes - in real app, this would call an API
   const submission = {
     studentId: 'current-student-id', // This would come from session
     studentName: 'Current Student', // This would come from session
     content: submissionText,
     date: new Date().toISOString(),
-    files: []
+    files: Array.from(filesInput.files).map(file => ({ name: file.name, type: file.type }))
   };
   
-  // Handle file uploads
-  if (filesInput.files.length > 0) {
-    for (let i = 0; i < filesInput.files.length; i++) {
-      const file = filesInput.files[i];
-      const reader = new FileReader();
-      
-      reader.onload = function(e) {
-        submission.files.push({
-          name: file.name,
-          type: file.type,
-          content: e.target.result
-        });
-        
-        // If this is the last file, save the submission
-        if (i === filesInput.files.length - 1) {
-          saveSubmission(assignment, submission);
-        }
-      };
-      
-      reader.readAsDataURL(file);
+  // Upload the raw files as multipart form data
+  const formData = new FormData();
+  formData.append('content', submissionText);
+  Array.from(filesInput.files).forEach(file => formData.append('files', file));
+  
+  uploadSubmission(assignmentId, formData, assignment, submission);
+}
+
+// Send the submission to the server, then record it locally
+async function uploadSubmission(assignmentId, formData, assignment, submission) {
+  try {
+    const response = await fetch(`/api/student/assignments/${assignmentId}/submission`, {
+      method: 'POST',
+      body: formData
+    });
+    
+    if (!response.ok) {
+      const result = await response.json();
+      alert(result.error || 'Failed to submit assignment');
+      return;
     }
-  } else {
-    saveSubmission(assignment, submission);
+  } catch (error) {
+    console.error('Error submitting assignment:', error);
+    alert('Error submitting assignment. Please try again.');
+    return;
   }
+  
+  saveSubmission(assignment, submission);
 }
 
 // Save submission to assignment
@@ -919,6 +1044,53 @@ function base64ToBlob(base64) {
   return new Blob([uInt8Array], { type: contentType });
 }
 
+// Live notifications (Server-Sent Events)
+let notifications = [];
+let unreadNotifications = 0;
+
+function initializeNotifications() {
+  const bell = document.querySelector('.notification-icon');
+  const badge = document.querySelector('.notification-badge');
+  if (!bell || !badge || !window.EventSource) return;
+  
+  function updateBadge() {
+    badge.textContent = unreadNotifications;
+    badge.style.display = unreadNotifications > 0 ? '' : 'none';
+  }
+  
+  // EventSource reconnects on its own and sends Last-Event-ID, so missed
+  // notifications are replayed by the server
+  const source = new EventSource('/api/notifications/stream');
+  source.addEventListener('notification', (e) => {
+    const notification = JSON.parse(e.data);
+    notifications.unshift(notification);
+    notifications = notifications.slice(0, 20);
+    unreadNotifications++;
+    updateBadge();
+  });
+  
+  bell.addEventListener('click', async (e) => {
+    e.stopPropagation();
+    if (notifications.length === 0) {
+      try {
+        const response = await fetch('/api/notifications');
+        if (response.ok) {
+          notifications = await response.json();
+        }
+      } catch (error) {
+        console.error('Error loading notifications:', error);
+      }
+    }
+    unreadNotifications = 0;
+    updateBadge();
+    alert(notifications.length > 0
+      ? notifications.map(n => `• ${n.message}`).join('\n')
+      : 'No notifications yet');
+  });
+  
+  updateBadge();
+}
+
 // Calendar functionality
 function initializeCalendar() {
   const monthYear = document.getElementById('month-year');
@@ -966,19 +1138,8 @@ function initializeCalendar() {
   }
   
   function hasEventOnDate(dateKey) {
-    // Check for assignment deadlines on this date
-    for (const classItem of enrolledClasses) {
-      if (classItem.assignments) {
-        for (const assignment of classItem.assignments) {
-          const dueDate = new Date(assignment.dueDate);
-          const assignmentDateKey = `${dueDate.getFullYear()}-${dueDate.getMonth() + 1}-${dueDate.getDate()}`;
-          if (assignmentDateKey === dateKey) {
-            return true;
-          }
-        }
-      }
-    }
-    return false;
+    // Events (including assignment deadlines) come from the server per month
+    return Boolean(calendarEvents[dateKey] && calendarEvents[dateKey].length > 0);
   }
   
   function showEventsForDate(year, month, day) {
@@ -993,20 +1154,8 @@ function initializeCalendar() {
       day: 'numeric' 
     });
     
-    // Find assignments due on this date
-    const events = [];
-    enrolledClasses.forEach(classItem => {
-      if (classItem.assignments) {
-        classItem.assignments.forEach(assignment => {
-          const dueDate = new Date(assignment.dueDate);
-          if (dueDate.getFullYear() === year && 
-              dueDate.getMonth() === month && 
-              dueDate.getDate() === day) {
-            events.push(`Assignment: ${assignment.title} (${classItem.name})`);
-          }
-        });
-      }
-    });
+    // Events and deadlines loaded for the visible month
+    const events = calendarEvents[`${year}-${month + 1}-${day}`] || [];
     
     eventList.innerHTML = '';
     if (events.length === 0) {
@@ -1020,26 +1169,70 @@ function initializeCalendar() {
     }
   }
   
+  // Fetch only the visible month from the server, then draw it
+  async function loadAndRenderCalendar() {
+    renderCalendar();
+    await loadCalendarEvents(currentDate.getFullYear(), currentDate.getMonth());
+    renderCalendar();
+  }
+  
   prevMonth.addEventListener('click', () => {
     currentDate.setMonth(currentDate.getMonth() - 1);
-    renderCalendar();
+    loadAndRenderCalendar();
   });
   
   nextMonth.addEventListener('click', () => {
     currentDate.setMonth(currentDate.getMonth() + 1);
-    renderCalendar();
+    loadAndRenderCalendar();
   });
   
-  renderCalendar();
+  loadAndRenderCalendar();
+}
+
+// Format a Date as YYYY-MM-DD for the calendar API
+function toIsoDate(date) {
+  const month = String(date.getMonth() + 1).padStart(2, '0');
+  const day = String(date.getDate()).padStart(2, '0');
+  return `${date.getFullYear()}-${month}-${day}`;
+}
+
+// Load events for one month from the server into calendarEvents
+async function loadCalendarEvents(year, month) {
+  const from = toIsoDate(new Date(year, month, 1));
+  const to = toIsoDate(new Date(year, month + 1, 0));
+  
+  try {
+    const response = await fetch(`/api/calendar/events?from=${from}&to=${to}`);
+    if (!response.ok) {
+      console.error('Failed to load calendar events:', response.status);
+      return;
+    }
+    const events = await response.json();
+    
+    calendarEvents = {};
+    events.forEach(event => {
+      const [y, m, d] = event.date.split('-').map(Number);
+      const dateKey = `${y}-${m}-${d}`;
+      if (!calendarEvents[dateKey]) {
+        calendarEvents[dateKey] = [];
+      }
+      const label = event.source === 'assignment' ? `Assignment: ${event.title}` : event.title;
+      calendarEvents[dateKey].push(event.class_name ? `${label} (${event.class_name})` : label);
+    });
+  } catch (error) {
+    console.error('Error loading calendar events:', error);
+  }
 }
 
 // Update dashboard statistics
 async function updateDashboardStats() {
   try {
-    const response = await fetch('/api/student/stats');
-    if (response.ok) {
-      const stats = await response.json();
-      
+    let stats = takeBootstrap('stats');
+    if (!stats) {
+      const response = await fetch('/api/student/stats');
+      stats = response.ok ? await response.json() : null;
+    }
+    if (stats) {
       document.getElementById('enrolled-classes-count').textContent = stats.enrolled_classes;
       document.getElementById('pending-assignments').textContent = stats.pending_assignments;
       document.getElementById('upcoming-deadlines').textContent = stats.upcoming_deadlines;
@@ -1249,16 +1442,38 @@ function updateRecentActivity() {
   });
 }
 
-// Save enrolled classes to localStorage (for demo)
+// Save enrolled classes to localStorage together with their change-feed position
 function saveEnrolledClasses() {
-  localStorage.setItem('enrolledClasses', JSON.stringify(enrolledClasses));
+  localStorage.setItem('enrolledClasses', JSON.stringify({ owner: syncOwner, seq: syncSeq, classes: enrolledClasses }));
+  updateSyncCookie();
+}
+
+// Tell the dashboard page which list we hold so it embeds only the changes since
+function updateSyncCookie() {
+  if (syncOwner && syncSeq !== null) {
+    document.cookie = `class_sync=${syncOwner}:${syncSeq}; path=/dashboard; max-age=2592000; SameSite=Lax`;
+  } else {
+    document.cookie = 'class_sync=; path=/dashboard; max-age=0';
+  }
 }
 
-// Load enrolled classes from localStorage (for demo)
+// Load enrolled classes from localStorage (a bare array is the old demo format);
+// a list cached for another account is ignored
 function loadEnrolledClassesFromStorage() {
   const saved = localStorage.getItem('enrolledClasses');
-  if (saved) {
-    enrolledClasses = JSON.parse(saved);
+  if (!saved) return;
+  try {
+    const parsed = JSON.parse(saved);
+    if (Array.isArray(parsed)) {
+      enrolledClasses = parsed;
+      syncSeq = null;
+    } else if (!syncOwner || parsed.owner === syncOwner) {
+      enrolledClasses = parsed.classes || [];
+      syncSeq = typeof parsed.seq === 'number' ? parsed.seq : null;
+      syncOwner = parsed.owner || null;
+    }
+  } catch (error) {
+    console.error('Invalid saved classes:', error);
   }
 }
 
@@ -1299,10 +1514,15 @@ function initializeSampleData() {
 
 // Initialize the application
 function init() {
-  loadEnrolledClassesFromStorage();
-  initializeSampleData();
-  renderClassList();
-  updateDashboardStats();
+  // Fall back to the demo copy only when the server embedded nothing and no
+  // synced class list was loaded; otherwise it would overwrite real data and
+  // fire a second stats request
+  if (!bootstrapData && syncSeq === null) {
+    loadEnrolledClassesFromStorage();
+    initializeSampleData();
+    renderClassList();
+    updateDashboardStats();
+  }
   loadAllAssignments();
   loadAllGrades();
 }